@@ -0,0 +1,295 @@
+"""Performance harness for the browser's pipeline stages
+
+Run from the browser directory, for example:
+
+    python benchmark.py parsers testing/test.html https://browser.engineering/
+    python benchmark.py layout --paragraphs 20 --depth 10000
+"""
+
+import argparse
+import time
+import tracemalloc
+from css_parser import CSSParser
+from html_parser import HTMLParser, Node, Text, tree_to_list
+from layout import DocumentLayout, text_measurement_stats
+from parser_backends import PARSER_BACKENDS, DEFAULT_PARSER_BACKEND
+from style import (
+    CompiledStylesheet,
+    reset_style_sharing_stats,
+    style,
+    style_sharing_stats,
+)
+from style_profiler import StyleProfiler
+from tab import DEFAULT_STYLE_SHEET_CSS, paint_tree
+from url import URL
+
+DEFAULT_CORPUS = ["testing/test.html"]
+SAMPLE_WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit".split()
+SAMPLE_TAGS = ["div", "p", "span", "a", "li", "ul", "h2", "b", "i", "section"]
+
+
+def generate_document(paragraphs: int, depth: int = 0) -> str:
+    """Builds a synthetic page with nesting, attributes and references
+
+    depth wraps the content in that many extra nested sections.
+    """
+    parts = ["<html><head><title>Generated</title></head><body>"]
+    parts.append("<section>" * depth)
+    for i in range(paragraphs):
+        words = " ".join(SAMPLE_WORDS[(i + j) % len(SAMPLE_WORDS)] for j in range(40))
+        parts.append(
+            f'<div class="section s{i % 7}"><h2 id="h{i}">Heading {i}</h2>'
+            f"<p>{words} &amp; <b>bold</b> <a href='#h{i}'>link</a> &copy;</p>"
+            "<ul><li>one</li><li>two <i>three</i></li></ul></div>"
+        )
+    parts.append("</section>" * depth)
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def generate_stylesheet(rules: int) -> str:
+    """Builds a stylesheet mixing tag, class and descendant rules"""
+    parts = []
+    for i in range(rules):
+        tag = SAMPLE_TAGS[i % len(SAMPLE_TAGS)]
+        match i % 4:
+            case 0:
+                selector = f".c{i}"
+            case 1:
+                selector = f".s{i % 7} {tag}"
+            case 2:
+                selector = f"{tag} .c{i}"
+            case 3:
+                selector = f"div > {tag}"
+        parts.append(f"{selector} {{ color: #{i % 4096:03x}; }}")
+    return "\n".join(parts)
+
+
+class LinearRules(CompiledStylesheet):
+    """Offers every rule to every node, like style() did before indexing"""
+
+    def __init__(self, rules):
+        super().__init__(rules)
+        # no ancestor keys, every descendant rule walks the parents
+        self.linear_rules = [(*rule, ()) for rule in self.rules]
+
+    def candidates(self, node: Node):
+        return self.linear_rules
+
+
+def load_corpus(sources: list[str]) -> list[tuple[str, str]]:
+    corpus = []
+    for source in sources:
+        if "://" in source:
+            _, body, _ = URL({}, source).request()
+        else:
+            body = open(source, encoding="utf-8").read()
+        corpus.append((source, body))
+    return corpus
+
+
+def best_time(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def peak_memory(fn) -> int:
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def retained_memory(fn) -> int:
+    """Bytes allocated by fn that are still alive when it returns"""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def describe(node: Node) -> str:
+    if isinstance(node, Text):
+        return f"text {node.text[:30]!r}"
+    return f"<{node.tag} {node.attributes}>"
+
+
+def first_difference(expected: Node, actual: Node) -> str | None:
+    """Describes where two trees first differ, None when they match"""
+    stack = [(expected, actual, "")]
+    while stack:
+        a, b, path = stack.pop()
+        if type(a) is not type(b):
+            return f"{path}: {describe(a)} != {describe(b)}"
+        if isinstance(a, Text):
+            if a.text != b.text:
+                return f"{path}: {describe(a)} != {describe(b)}"
+            continue
+        path = f"{path}/{a.tag}"
+        if a.tag != b.tag or a.attributes != b.attributes:
+            return f"{path}: {describe(a)} != {describe(b)}"
+        if len(a.children) != len(b.children):
+            return (
+                f"{path}: {len(a.children)} children != {len(b.children)}"
+                f" ({', '.join(describe(c) for c in b.children[:3])}...)"
+            )
+        for i in reversed(range(len(a.children))):
+            stack.append((a.children[i], b.children[i], f"{path}[{i}]"))
+    return None
+
+
+def benchmark_parsers(corpus: list[tuple[str, str]], repeat: int):
+    reference = PARSER_BACKENDS[DEFAULT_PARSER_BACKEND]
+    print(
+        f"{'document':<32} {'backend':<8} {'nodes':>7} {'MB/s':>7} {'peak MB':>8}  diff"
+    )
+    for name, body in corpus:
+        expected = reference.parse(body)
+        size_mb = len(body.encode("utf-8")) / 1e6
+        for backend in PARSER_BACKENDS.values():
+            tree = backend.parse(body)
+            seconds = best_time(lambda: backend.parse(body), repeat)
+            peak_mb = peak_memory(lambda: backend.parse(body)) / 1e6
+            difference = first_difference(expected, tree)
+            print(
+                f"{name[-32:]:<32} {backend.name:<8} {len(tree_to_list(tree, [])):>7}"
+                f" {size_mb / seconds:>7.2f} {peak_mb:>8.2f}  {difference or 'same'}"
+            )
+
+
+def benchmark_style(
+    paragraphs: int, depth: int, rules: int, repeat: int, profile: bool = False
+):
+    tree = HTMLParser(generate_document(paragraphs, depth)).parse()
+    parsed_rules = CSSParser(generate_stylesheet(rules)).parse()
+    print(f"nodes: {len(tree_to_list(tree, []))}, rules: {len(parsed_rules)}")
+    results = {}
+    for name, rule_set in [
+        ("linear", LinearRules(parsed_rules)),
+        ("indexed", CompiledStylesheet(parsed_rules)),
+    ]:
+        results[name] = best_time(lambda: style(tree, rule_set), repeat)
+        print(f"{name:<8} {results[name] * 1000:>9.1f}ms")
+    print(f"speedup  {results['linear'] / results['indexed']:>9.1f}x")
+    reset_style_sharing_stats()
+    style(tree, CompiledStylesheet(parsed_rules))
+    styles = {id(node.style) for node in tree_to_list(tree, [])}
+    sharing = style_sharing_stats()
+    print(f"shared   {sharing['hits']:>9} nodes")
+    print(f"unshared {sharing['misses']:>9} nodes")
+    print(f"styles   {len(styles):>9} objects")
+    fresh_tree = HTMLParser(generate_document(paragraphs, depth)).parse()
+    index = CompiledStylesheet(parsed_rules)
+    memory = retained_memory(lambda: style(fresh_tree, index))
+    print(f"memory   {memory / 1024:>9.0f}KB")
+    if profile:
+        profiler = StyleProfiler()
+        style_tree = HTMLParser(generate_document(paragraphs, depth)).parse()
+        profiler.restyle(style_tree, CompiledStylesheet(parsed_rules))
+        print(profiler.report_text())
+
+
+def benchmark_layout(paragraphs: int, depth: int, repeat: int):
+    tree = HTMLParser(generate_document(paragraphs, depth)).parse()
+    stylesheet = CompiledStylesheet(CSSParser(DEFAULT_STYLE_SHEET_CSS).parse())
+    style_seconds = best_time(lambda: style(tree, stylesheet), repeat)
+    words = sum(
+        len(n.text.split()) for n in tree_to_list(tree, []) if isinstance(n, Text)
+    )
+    print(f"nodes: {len(tree_to_list(tree, []))}, words: {words}")
+    before = text_measurement_stats()
+    seconds = best_time(lambda: DocumentLayout(tree).layout(), repeat)
+    after = text_measurement_stats()
+    lookups = after["hits"] + after["misses"] - before["hits"] - before["misses"]
+    hits = after["hits"] - before["hits"]
+    document = DocumentLayout(tree)
+    document.layout()
+    paint_seconds = best_time(lambda: paint_tree(document, []), repeat)
+    print(f"style    {style_seconds * 1000:>9.1f}ms")
+    print(f"layout   {seconds * 1000:>9.1f}ms")
+    print(f"paint    {paint_seconds * 1000:>9.1f}ms")
+    print(f"measured {after['measurements'] - before['measurements']:>9} times")
+    print(f"hit rate {hits / max(lookups, 1):>9.1%}")
+
+
+def benchmark_css(corpus: list[tuple[str, str]], repeat: int):
+    print(f"{'stylesheet':<32} {'KB':>7} {'rules':>7} {'ms':>8} {'MB/s':>7}")
+    for name, css in corpus:
+        rules = CSSParser(css).parse()
+        seconds = best_time(lambda: CSSParser(css).parse(), repeat)
+        size_mb = len(css.encode("utf-8")) / 1e6
+        print(
+            f"{name[-32:]:<32} {size_mb * 1000:>7.0f} {len(rules):>7}"
+            f" {seconds * 1000:>8.1f} {size_mb / seconds:>7.2f}"
+        )
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = arg_parser.add_subparsers(dest="command", required=True)
+    parsers = subparsers.add_parser("parsers", help="compare HTML parser backends")
+    parsers.add_argument("sources", nargs="*", help="files or urls to parse")
+    parsers.add_argument("--repeat", type=int, default=3)
+    parsers.add_argument(
+        "--generated",
+        type=int,
+        default=2000,
+        help="paragraphs in a generated document added to the corpus (0 for none)",
+    )
+    style_parser = subparsers.add_parser("style", help="time style resolution")
+    style_parser.add_argument("--paragraphs", type=int, default=700)
+    style_parser.add_argument("--depth", type=int, default=0)
+    style_parser.add_argument("--rules", type=int, default=2000)
+    style_parser.add_argument("--repeat", type=int, default=3)
+    style_parser.add_argument(
+        "--profile", action="store_true", help="report the most expensive rules"
+    )
+    layout_parser = subparsers.add_parser("layout", help="time style, layout and paint")
+    layout_parser.add_argument("--paragraphs", type=int, default=700)
+    layout_parser.add_argument(
+        "--depth", type=int, default=0, help="sections the content is nested in"
+    )
+    layout_parser.add_argument("--repeat", type=int, default=3)
+    css_parser = subparsers.add_parser("css", help="time stylesheet parsing")
+    css_parser.add_argument("sources", nargs="*", help="files or urls to parse")
+    css_parser.add_argument("--repeat", type=int, default=3)
+    css_parser.add_argument(
+        "--generated",
+        type=int,
+        default=10000,
+        help="rules in a generated stylesheet added to the corpus (0 for none)",
+    )
+    args = arg_parser.parse_args()
+
+    if args.command == "parsers":
+        corpus = load_corpus(args.sources or DEFAULT_CORPUS)
+        if args.generated:
+            corpus.append(
+                (f"generated-{args.generated}", generate_document(args.generated))
+            )
+        benchmark_parsers(corpus, args.repeat)
+    elif args.command == "style":
+        benchmark_style(
+            args.paragraphs, args.depth, args.rules, args.repeat, args.profile
+        )
+    elif args.command == "layout":
+        benchmark_layout(args.paragraphs, args.depth, args.repeat)
+    elif args.command == "css":
+        corpus = load_corpus(args.sources or ["browser.css"])
+        if args.generated:
+            corpus.append(
+                (f"generated-{args.generated}", generate_stylesheet(args.generated))
+            )
+        benchmark_css(corpus, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
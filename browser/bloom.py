@@ -0,0 +1,36 @@
+BLOOM_FILTER_BITS = 12
+
+
+class CountingBloomFilter:
+    """Bloom filter over integer keys that also supports removal
+
+    Each key bumps two counters picked from its bits. A key is definitely
+    absent when either of its counters is zero; a false positive only costs
+    the exact check the filter was meant to skip.
+    """
+
+    def __init__(self, bits: int = BLOOM_FILTER_BITS):
+        self.bits = bits
+        self.mask = (1 << bits) - 1
+        self.counters = [0] * (1 << bits)
+
+    def add(self, key: int):
+        self.counters[key & self.mask] += 1
+        self.counters[(key >> self.bits) & self.mask] += 1
+
+    def remove(self, key: int):
+        self.counters[key & self.mask] -= 1
+        self.counters[(key >> self.bits) & self.mask] -= 1
+
+    def might_contain(self, key: int) -> bool:
+        return bool(
+            self.counters[key & self.mask]
+            and self.counters[(key >> self.bits) & self.mask]
+        )
+
+    def might_contain_all(self, keys: tuple[int, ...]) -> bool:
+        counters, mask, bits = self.counters, self.mask, self.bits
+        for key in keys:
+            if not counters[key & mask] or not counters[(key >> bits) & mask]:
+                return False
+        return True
@@ -12,7 +12,10 @@ from display_constants import (
     WIDTH,
     VSTEP,
 )
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
+from parser_backends import DEFAULT_PARSER_BACKEND, PARSER_BACKENDS
+from style_profiler import PROFILE_FORMATS
 from PIL import ImageTk, Image
 from tab import Tab
 
@@ -22,6 +25,7 @@ DEFAULT_FILE = "file://testing/test.html"
 HOME_IMAGE = "img/home.png"
 HOME_IMAGE_WIDTH = 24
 HOME_IMAGE_HEIGHT = 20
+PARSE_WORKERS = 2
 
 
 class Focusable(Enum):
@@ -369,11 +373,19 @@ class Chrome:
 
 
 class Browser:
-    def __init__(self):
+    def __init__(
+        self,
+        parser_backend: str = DEFAULT_PARSER_BACKEND,
+        profile_style: str | None = None,
+    ):
+        self.parser_backend = parser_backend
+        self.profile_style = profile_style
         self.cookie_jar: dict[str, str] = {}
         self.url_cache: dict[url.URL, (str, int, int)] = {}
         self.tabs: list[Tab] = []
         self.active_tab: Tab | None = None
+        # big documents are parsed here so the window stays responsive
+        self.parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
         if sdl2.SDL_BYTEORDER == sdl2.SDL_BIG_ENDIAN:
             self.color_masks = {
                 "RED_MASK": 0xFF000000,
@@ -471,7 +483,14 @@ class Browser:
         # self.canvas.config(cursor=cursor)
 
     def new_tab(self, url):
-        new_tab = Tab(self.cookie_jar, self.url_cache, HEIGHT - self.chrome.bottom)
+        new_tab = Tab(
+            self.cookie_jar,
+            self.url_cache,
+            HEIGHT - self.chrome.bottom,
+            self.parse_pool,
+            self.parser_backend,
+            self.profile_style,
+        )
         new_tab.load(url)
         self.active_tab = new_tab
         self.tabs.append(new_tab)
@@ -479,6 +498,14 @@ class Browser:
         self.raster_tab()
         self.draw()
     
+    def poll_tabs(self):
+        """Shows pages whose documents finished parsing in the background"""
+        for tab in self.tabs:
+            if tab.poll_parse() and tab == self.active_tab:
+                self.raster_chrome()
+                self.raster_tab()
+                self.draw()
+
     def raster_tab(self):
         tab_height = math.ceil(self.active_tab.document.height + 2 * VSTEP)
         if not self.tab_surface or tab_height != self.tab_surface.height():
@@ -539,6 +566,7 @@ class Browser:
         sdl2.SDL_UpdateWindowSurface(self.sdl_window)
 
     def handle_quit(self):
+        self.parse_pool.shutdown(wait=False, cancel_futures=True)
         sdl2.SDL_DestroyWindow(self.sdl_window)
 
 
@@ -577,17 +605,28 @@ def mainloop(browser: Browser):
                     browser.handle_event(Event.KEY, event)
                 case sdl2.SDL_MOUSEWHEEL:
                     browser.scroll_mouse(event.wheel)
+        browser.poll_tabs()
 
 
 if __name__ == "__main__":
+    import argparse
     import sys
 
-    sdl2.SDL_Init(sdl2.SDL_INIT_EVENTS)
+    arg_parser = argparse.ArgumentParser(description=DEFAULT_BROWSER_TITLE)
+    arg_parser.add_argument("url", nargs="?", default=DEFAULT_FILE)
+    arg_parser.add_argument(
+        "--parser", choices=list(PARSER_BACKENDS), default=DEFAULT_PARSER_BACKEND
+    )
+    arg_parser.add_argument(
+        "--profile-style",
+        nargs="?",
+        const="text",
+        choices=PROFILE_FORMATS,
+        help="print the most expensive style rules after each page load",
+    )
+    args = arg_parser.parse_args()
 
-    if not len(sys.argv) > 1:
-        arg = DEFAULT_FILE
-    else:
-        arg = sys.argv[1]
-    b = Browser()
-    b.new_tab(arg)
+    sdl2.SDL_Init(sdl2.SDL_INIT_EVENTS)
+    b = Browser(args.parser, args.profile_style)
+    b.new_tab(args.url)
     mainloop(b)
@@ -0,0 +1,161 @@
+import weakref
+from collections.abc import Iterator, Mapping
+from css_values import (
+    BLACK,
+    DisplayValue,
+    FontKey,
+    VerticalAlign,
+    parse_background_color,
+    parse_color,
+    parse_display,
+    parse_font_key,
+    parse_pixels,
+    parse_radius,
+    parse_vertical_align,
+)
+from display_constants import DEFAULT_FONT_SIZE_PX
+from types import MappingProxyType
+
+INHERITED_PROPERTIES = {
+    "font-family": "Times",
+    "font-size": f"{DEFAULT_FONT_SIZE_PX}px",
+    "font-style": "normal",
+    "font-weight": "normal",
+    "color": "black",
+    "cursor": "auto",
+}
+INHERITED_INDEX = {name: i for i, name in enumerate(INHERITED_PROPERTIES)}
+DEFAULT_INHERITED = tuple(INHERITED_PROPERTIES.values())
+
+
+class ComputedStyle(Mapping):
+    """An immutable computed style, equal styles are the same object
+
+    Inherited properties are a tuple taken from the parent by reference
+    unless the node changes one of them, own is a read-only copy of the
+    other properties set on the node. Reads work like a dict.
+
+    The values layout and paint use are also resolved once per style into
+    typed fields: font_key, display, vertical_align, color and
+    background_color as packed ints, border_radius, and width and height in
+    pixels or None.
+    """
+
+    __slots__ = (
+        "inherited",
+        "own",
+        "font_key",
+        "display",
+        "vertical_align",
+        "color",
+        "background_color",
+        "border_radius",
+        "width",
+        "height",
+        "__weakref__",
+    )
+    font_key: FontKey
+    display: DisplayValue | None
+    vertical_align: VerticalAlign
+    color: int
+    background_color: int | None
+    border_radius: float
+    width: int | None
+    height: int | None
+    # every live style, keyed by its contents
+    table: "weakref.WeakValueDictionary[tuple, ComputedStyle]" = (
+        weakref.WeakValueDictionary()
+    )
+
+    def __new__(cls, inherited: tuple[str, ...], own: Mapping[str, str]):
+        key = (inherited, frozenset(own.items()))
+        style = cls.table.get(key)
+        if style is None:
+            style = super().__new__(cls)
+            object.__setattr__(style, "inherited", inherited)
+            # a copy, so the caller's dict can't drift from the key
+            object.__setattr__(style, "own", MappingProxyType(dict(own)))
+            style.resolve_values()
+            cls.table[key] = style
+        return style
+
+    @classmethod
+    def from_values(
+        cls, parent: Mapping[str, str] | None, values: dict[str, str]
+    ) -> "ComputedStyle":
+        """Style of a node with parent's style that sets values"""
+        if isinstance(parent, ComputedStyle):
+            inherited = parent.inherited
+        elif not parent:
+            inherited = DEFAULT_INHERITED
+        else:
+            inherited = tuple(parent[name] for name in INHERITED_PROPERTIES)
+        changed = None
+        own = {}
+        for name, value in values.items():
+            i = INHERITED_INDEX.get(name)
+            if i is None:
+                own[name] = value
+            elif inherited[i] != value:
+                if changed is None:
+                    changed = list(inherited)
+                changed[i] = value
+        if changed is not None:
+            inherited = tuple(changed)
+        return cls(inherited, own)
+
+    def resolve_values(self):
+        values = {
+            "font_key": parse_font_key(
+                self["font-family"],
+                self["font-size"],
+                self["font-weight"],
+                self["font-style"],
+            ),
+            "display": parse_display(self.own.get("display")),
+            "vertical_align": parse_vertical_align(self.own.get("vertical-align")),
+            "color": parse_color(self["color"]),
+            "background_color": parse_background_color(
+                self.own.get("background", ""), self.own.get("background-color")
+            ),
+            "border_radius": parse_radius(self.own.get("border-radius", "0px")),
+            "width": parse_pixels(self.own.get("width", "")),
+            "height": parse_pixels(self.own.get("height", "")),
+        }
+        if values["color"] is None:
+            values["color"] = BLACK
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def with_values(self, values: dict[str, str]) -> "ComputedStyle":
+        """A copy of this style with values changed"""
+        return ComputedStyle.from_values(self, {**self.own, **values})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ComputedStyle is immutable")
+
+    def __getitem__(self, name: str) -> str:
+        i = INHERITED_INDEX.get(name)
+        if i is not None:
+            return self.inherited[i]
+        return self.own[name]
+
+    def __contains__(self, name: object) -> bool:
+        return name in INHERITED_INDEX or name in self.own
+
+    def __iter__(self) -> Iterator[str]:
+        yield from INHERITED_PROPERTIES
+        yield from self.own
+
+    def __len__(self) -> int:
+        return len(INHERITED_PROPERTIES) + len(self.own)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ComputedStyle):
+            return self is other
+        return super().__eq__(other)
+
+    __hash__ = object.__hash__
+
+    def __repr__(self):
+        return f"ComputedStyle({dict(self)!r})"
@@ -1,34 +1,131 @@
 import html_parser
+import re
+from collections.abc import Callable
 from dataclasses import dataclass, field
+from media_queries import MediaGroup, MediaQueryList, parse_media_query_list
 
 type Selector = TagSelector | DescendantSelector
+# a selector compiled to a function of a node
+type Matcher = Callable[[html_parser.Node], bool]
 
 MEDIA_TAG = "@media"
 UNIVERSAL_SELECTOR = "*"
 PROPERY_VALUE_ALLOWED_CHARS = "@#-.%'" + '"'
+WHITESPACE_REGEX = re.compile(r"\s*")
+# compiled scanners, keyed by their extra or stop characters
+WORD_REGEXES: dict[str, re.Pattern] = {}
+IGNORE_UNTIL_REGEXES: dict[str, re.Pattern] = {}
+
+
+def word_pattern(extra_allowed_chars: str) -> str:
+    """Matches a run of word or allowed characters
+
+    Word characters are the str.isalnum ones plus "_", which ends a word
+    for CSSParser, callers check for it.
+    """
+    allowed = re.escape(PROPERY_VALUE_ALLOWED_CHARS + extra_allowed_chars)
+    return f"[\\w{allowed}]++"
+
+
+def word_regex(extra_allowed_chars: str) -> re.Pattern:
+    if extra_allowed_chars not in WORD_REGEXES:
+        WORD_REGEXES[extra_allowed_chars] = re.compile(
+            word_pattern(extra_allowed_chars)
+        )
+    return WORD_REGEXES[extra_allowed_chars]
+
+
+def ignore_until_regex(chars: str) -> re.Pattern:
+    if chars not in IGNORE_UNTIL_REGEXES:
+        IGNORE_UNTIL_REGEXES[chars] = re.compile(f"[^{re.escape(chars)}]*")
+    return IGNORE_UNTIL_REGEXES[chars]
+
+
+# well formed pieces, matching exactly what the step by step methods accept;
+# input with "_" or anything unexpected takes the step by step path
+PROPERTY_PATTERN = word_pattern("")
+VALUE_PATTERN = word_pattern(", ")
+PAIR_END_PATTERN = r"(?:;\s*+|(?=\})|\Z)"
+# a "prop: value" pair and the ';' after it in body()
+PAIR_REGEX = re.compile(
+    rf"\s*+({PROPERTY_PATTERN})\s*+:\s*+({VALUE_PATTERN})\s*+{PAIR_END_PATTERN}"
+)
+SELECTOR_PATTERN = rf"{word_pattern('*')}\s*+(?>[,>]?\s*+{PROPERTY_PATTERN}\s*+)*"
+# one part of a selector list and the combinator before it
+SELECTOR_PART_REGEX = re.compile(rf"\s*+([,>]?)\s*+({word_pattern('*')})")
+# a whole rule with its selectors and declarations
+RULE_REGEX = re.compile(
+    rf"\s*+({SELECTOR_PATTERN})\{{\s*+"
+    rf"((?>\s*+{PROPERTY_PATTERN}\s*+:\s*+{VALUE_PATTERN}\s*+{PAIR_END_PATTERN})*)\}}"
+)
+
+
+def class_matcher(class_name: str) -> Matcher:
+    element = html_parser.Element
+
+    def matches(node: html_parser.Node) -> bool:
+        return isinstance(node, element) and class_name in node.classes()
+
+    return matches
+
+
+def tag_matcher(tag: str) -> Matcher:
+    element = html_parser.Element
+    if tag == UNIVERSAL_SELECTOR:
+        return lambda node: isinstance(node, element)
+
+    def matches(node: html_parser.Node) -> bool:
+        return isinstance(node, element) and node.tag == tag
+
+    return matches
+
+
+def descendant_matcher(ancestor: Matcher, descendant: Matcher) -> Matcher:
+    def matches(node: html_parser.Node) -> bool:
+        if not descendant(node):
+            return False
+        node = node.parent
+        while node:
+            if ancestor(node):
+                return True
+            node = node.parent
+        return False
+
+    return matches
+
+
+def direct_descendant_matcher(ancestor: Matcher, descendant: Matcher) -> Matcher:
+    def matches(node: html_parser.Node) -> bool:
+        return descendant(node) and node.parent is not None and ancestor(node.parent)
+
+    return matches
 
 
 @dataclass
 class ClassSelector:
     class_selector: str
     priority: int = 1
+    # compiled once, matches() and style() call it
+    matcher: Matcher = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.matcher = class_matcher(self.class_selector)
 
     def matches(self, node: html_parser.Node):
-        if not isinstance(node, html_parser.Element):
-            return False
-        classes = node.attributes.get("class", "").split(" ")
-        return self.class_selector in classes
+        return self.matcher(node)
 
 
 @dataclass
 class TagSelector:
     tag: str
     priority: int = 2
+    matcher: Matcher = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.matcher = tag_matcher(self.tag)
 
     def matches(self, node: html_parser.Node):
-        return isinstance(node, html_parser.Element) and (
-            self.tag == UNIVERSAL_SELECTOR or self.tag == node.tag
-        )
+        return self.matcher(node)
 
 
 type IndividualSelector = ClassSelector | TagSelector
@@ -46,18 +143,16 @@ class DescendantSelector:
     ancestor: IndividualSelector
     descendant: IndividualSelector
     priority: int = field(init=False)
+    matcher: Matcher = field(init=False, repr=False, compare=False)
 
     def __post_init__(self):
         self.priority = self.ancestor.priority + self.descendant.priority
+        self.matcher = descendant_matcher(
+            self.ancestor.matcher, self.descendant.matcher
+        )
 
     def matches(self, node: html_parser.Node):
-        if not self.descendant.matches(node):
-            return False
-        while node.parent:
-            if self.ancestor.matches(node.parent):
-                return True
-            node = node.parent
-        return False
+        return self.matcher(node)
 
 
 @dataclass
@@ -65,16 +160,16 @@ class DirectDescendantSelector:
     ancestor: IndividualSelector
     descendant: IndividualSelector
     priority: int = field(init=False)
+    matcher: Matcher = field(init=False, repr=False, compare=False)
 
     def __post_init__(self):
         self.priority = self.ancestor.priority + self.descendant.priority
+        self.matcher = direct_descendant_matcher(
+            self.ancestor.matcher, self.descendant.matcher
+        )
 
     def matches(self, node: html_parser.Node):
-        return (
-            self.descendant.matches(node)
-            and node.parent
-            and self.ancestor.matches(node.parent)
-        )
+        return self.matcher(node)
 
 
 class SelectorParsingException(Exception):
@@ -93,19 +188,24 @@ class CSSParser:
     def __init__(self, style):
         self.style = style
         self.i = 0
+        # selectors never change, rules with the same words can share them
+        self.simple_selectors: dict[str, IndividualSelector] = {}
+        # rules of @media blocks, parse() leaves them out of its rules
+        self.media_groups: list[MediaGroup] = []
 
     def parse(self):
         rules = []
         while self.i < len(self.style):
+            if self.simple_rule(rules):
+                continue
             try:
                 self.whitespace()
                 selectors = self.selector()
-                # ignoring media tags for now
                 if (
                     isinstance(selectors[0], TagSelector)
                     and selectors[0].tag == MEDIA_TAG
                 ):
-                    self.ignore_block()
+                    self.media_block(len(rules))
                     continue
                 self.literal("{")
                 self.whitespace()
@@ -138,6 +238,59 @@ class CSSParser:
 
         return rules
 
+    def simple_rule(self, rules: list) -> bool:
+        """Parses a well formed rule in one go, False to use the slow path"""
+        match = RULE_REGEX.match(self.style, self.i)
+        if not match or "_" in match.group():
+            return False
+        out = None
+        selectors = []
+        for combinator, word in SELECTOR_PART_REGEX.findall(match.group(1)):
+            selector = self.simple_selectors.get(word)
+            if selector is None:
+                selector = get_individual_selector(word.casefold())
+                self.simple_selectors[word] = selector
+            if out is None:
+                if isinstance(selector, TagSelector) and selector.tag == MEDIA_TAG:
+                    return False
+                out = selector
+            elif combinator == ",":
+                selectors.append(out)
+                out = selector
+            elif combinator == ">":
+                out = DirectDescendantSelector(out, selector)
+            else:
+                out = DescendantSelector(out, selector)
+        selectors.append(out)
+        pairs = PAIR_REGEX.findall(self.style, match.start(2), match.end(2))
+        body = {prop.casefold(): val.strip() for prop, val in pairs}
+        for selector in selectors:
+            rules.append((selector, body))
+        self.i = match.end()
+        return True
+
+    def media_block(self, position: int):
+        """Moves past an @media block, adding its rules to media_groups"""
+        start = self.i
+        self.ignore_block()
+        prelude, _, block = self.style[start : self.i].partition("{")
+        conditions = (parse_media_query_list(prelude),)
+        inner = CSSParser(block[:-1])
+        rules = inner.parse()
+        # split around nested blocks so the groups stay in source order
+        previous = 0
+        for group in inner.media_groups:
+            self.add_media_group(conditions, rules[previous : group.position], position)
+            previous = max(previous, group.position)
+            self.add_media_group(conditions + group.conditions, group.rules, position)
+        self.add_media_group(conditions, rules[previous:], position)
+
+    def add_media_group(
+        self, conditions: tuple[MediaQueryList, ...], rules: list, position: int
+    ):
+        if rules:
+            self.media_groups.append(MediaGroup(conditions, rules, position))
+
     def selector(self):
         try:
             out = get_individual_selector(self.word("*").casefold())
@@ -171,6 +324,12 @@ class CSSParser:
     def body(self):
         pairs = {}
         while self.i < len(self.style) and self.style[self.i] != "}":
+            match = PAIR_REGEX.match(self.style, self.i)
+            if match and "_" not in match.group():
+                prop, val = match.groups()
+                pairs[prop.casefold()] = val.strip()
+                self.i = match.end()
+                continue
             try:
                 prop, val = self.pair()
                 pairs[prop] = val
@@ -201,21 +360,16 @@ class CSSParser:
         return prop.casefold(), val.strip()
 
     def whitespace(self):
-        while self.i < len(self.style) and self.style[self.i].isspace():
-            self.i += 1
+        if self.i < len(self.style) and self.style[self.i].isspace():
+            self.i = WHITESPACE_REGEX.match(self.style, self.i).end()
 
     def word(self, extra_allowed_chars=""):
-        start = self.i
-        allowed_chars = PROPERY_VALUE_ALLOWED_CHARS + extra_allowed_chars
-        while self.i < len(self.style):
-            char = self.style[self.i]
-            if char.isalnum() or char in allowed_chars:
-                self.i += 1
-            else:
-                break
-        if not (self.i > start):
+        match = word_regex(extra_allowed_chars).match(self.style, self.i)
+        word = match.group().partition("_")[0] if match else ""
+        if not word:
             raise WordParsingException("Error parsing word")
-        return self.style[start : self.i]
+        self.i += len(word)
+        return word
 
     def literal(self, literal):
         if not (self.i < len(self.style) and self.style[self.i] == literal):
@@ -223,12 +377,9 @@ class CSSParser:
         self.i += 1
 
     def ignore_until(self, chars):
-        while self.i < len(self.style):
-            char = self.style[self.i]
-            if char in chars:
-                return char
-            else:
-                self.i += 1
+        self.i = ignore_until_regex("".join(chars)).match(self.style, self.i).end()
+        if self.i < len(self.style):
+            return self.style[self.i]
         return None
 
     def ignore_block(self):
@@ -7,6 +7,7 @@ from css_parser import (
     DirectDescendantSelector,
     ClassSelector,
 )
+from html_parser import HTMLParser, tree_to_list
 
 BODY_TEST_CASES = [
     ("default", "display: block;", {"display": "block"}),
@@ -27,6 +28,11 @@ BODY_TEST_CASES = [
         "display:block; jargon; background-color:red;",
         {"display": "block", "background-color": "red"},
     ),
+    (
+        "underscore ends a word",
+        "color: red; a_b: x; margin: 0",
+        {"color": "red", "margin": "0"},
+    ),
 ]
 
 PARSE_TEST_CASES = [
@@ -133,6 +139,25 @@ PARSE_TEST_CASES = [
             (TagSelector("li"), {"padding-left": "2px"}),
         ],
     ),
+    (
+        "skips words with underscores",
+        "h1 { a_b: red; color: blue; } li_x {padding-left:2px;} p{margin:0}",
+        [
+            (TagSelector("h1"), {"color": "blue"}),
+            (TagSelector("p"), {"margin": "0"}),
+        ],
+    ),
+    (
+        "unicode words and spacing",
+        "\u00c9L , .Note>B{ font-family: 'Times New', serif  }",
+        [
+            (TagSelector("\u00e9l"), {"font-family": "'Times New', serif"}),
+            (
+                DirectDescendantSelector(ClassSelector("note"), TagSelector("b")),
+                {"font-family": "'Times New', serif"},
+            ),
+        ],
+    ),
     (
         "skips media tags",
         "h1 { display: block}\n @media (max-width:800px) {p  {color: white;}}\n  li {padding-left:2px;}",
@@ -158,6 +183,55 @@ class TestCSSParser(unittest.TestCase):
                 parser = CSSParser(input)
                 self.assertEqual(parser.parse(), ans)
 
+    def test_media_blocks_become_groups(self):
+        parser = CSSParser(
+            "h1 { a: b } @media print, (min-width: 10px) { p { c: d } "
+            "@media (prefers-color-scheme: dark) { i { e: f } } b { g: h } } li { i: j }"
+        )
+        self.assertEqual(len(parser.parse()), 2)
+        groups = parser.media_groups
+        self.assertEqual(
+            [g.rules for g in groups],
+            [
+                [(TagSelector("p"), {"c": "d"})],
+                [(TagSelector("i"), {"e": "f"})],
+                [(TagSelector("b"), {"g": "h"})],
+            ],
+        )
+        self.assertEqual([g.position for g in groups], [1, 1, 1])
+        self.assertEqual([len(g.conditions) for g in groups], [1, 2, 1])
+        self.assertEqual(len(groups[0].conditions[0].queries), 2)
+
+    def test_compiled_matchers(self):
+        tree = HTMLParser(
+            "<ul class='list\tdark'><li><p class=x>a</p></li></ul><p>b</p>"
+        ).parse()
+        nodes = [n for n in tree_to_list(tree, []) if hasattr(n, "tag")]
+        cases = [
+            ("p", ["p", "p"]),
+            (".dark p", ["p"]),
+            ("ul > li", ["li"]),
+            ("ul > p", []),
+            ("ul li > .x", ["p"]),
+            ("*", [n.tag for n in nodes]),
+        ]
+        for selector_text, tags in cases:
+            with self.subTest(selector_text):
+                selector = CSSParser(selector_text).selector()[0]
+                matched = [n.tag for n in nodes if selector.matcher(n)]
+                self.assertEqual(matched, tags)
+                self.assertEqual([n.tag for n in nodes if selector.matches(n)], tags)
+
+    def test_class_matcher_sees_class_changes(self):
+        tree = HTMLParser("<p class='a b'>x</p>").parse()
+        p = next(n for n in tree_to_list(tree, []) if getattr(n, "tag", "") == "p")
+        selector = ClassSelector("c")
+        self.assertFalse(selector.matches(p))
+        self.assertFalse(selector.matches(p.children[0]))
+        p.set_attribute("class", "c")
+        self.assertTrue(selector.matches(p))
+        self.assertEqual(p.classes(), frozenset({"c"}))
+
 
 if __name__ == "__main__":
     unittest.main()
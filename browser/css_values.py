@@ -0,0 +1,130 @@
+import re
+from enum import Enum
+from display_constants import DEFAULT_FONT_SIZE_PX
+
+PIXEL_VALUE_REGEX = re.compile(r"(\d+)px")
+# packed 0xAARRGGBB, the same int skia.Color makes
+BLACK = 0xFF000000
+
+NAMED_COLORS = {
+    "black": "#000000",
+    "silver": "#c0c0c0",
+    "gray": "#808080",
+    "grey": "#808080",
+    "white": "#ffffff",
+    "maroon": "#800000",
+    "red": "#ff0000",
+    "purple": "#800080",
+    "fuchsia": "#ff00ff",
+    "green": "#008000",
+    "lime": "#00ff00",
+    "olive": "#808000",
+    "yellow": "#ffff00",
+    "navy": "#000080",
+    "blue": "#0000ff",
+    "teal": "#008080",
+    "aqua": "#00ffff",
+    "lightblue": "#add8e6",
+    "orange": "#ffa500",
+}
+
+
+class VerticalAlign(Enum):
+    BASELINE = "baseline"
+    SUB = "sub"
+    SUPER = "super"
+
+
+class DisplayValue(Enum):
+    BLOCK = "block"
+    INLINE = "inline"
+
+
+# family, size in points, weight and slant, the arguments of fonts.get_font
+type FontKey = tuple[str, int, str, str]
+
+
+def pack_color(r: int, g: int, b: int, a: int = 255) -> int:
+    return (a << 24) | (r << 16) | (g << 8) | b
+
+
+def parse_color(color: str) -> int | None:
+    """A hex or named color as a packed int, None if it isn't one"""
+    color = NAMED_COLORS.get(color, color)
+    if not color.startswith("#"):
+        return None
+    try:
+        if len(color) == 9:
+            return pack_color(
+                int(color[1:3], 16),
+                int(color[3:5], 16),
+                int(color[5:7], 16),
+                int(color[7:9], 16),
+            )
+        elif len(color) == 7:
+            return pack_color(
+                int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16)
+            )
+        elif len(color) == 4:
+            return pack_color(
+                int(color[1] * 2, 16), int(color[2] * 2, 16), int(color[3] * 2, 16)
+            )
+    except ValueError:
+        pass
+    return None
+
+
+def parse_background_color(background: str, background_color: str | None) -> int | None:
+    """The color painted behind a node, None for no background
+
+    background-color wins over the color in the last background layer.
+    """
+    if background_color is not None:
+        return parse_color(background_color)
+    if not background:
+        return None
+    colors = [parse_color(value) for value in background.split(",")[-1].split(" ")]
+    colors = [color for color in colors if color is not None]
+    return colors[-1] if colors else None
+
+
+def parse_pixels(value: str) -> int | None:
+    """Whole pixels in a length like "100px", None if there are none"""
+    match = PIXEL_VALUE_REGEX.search(value)
+    return int(match.group(1)) if match else None
+
+
+def parse_radius(value: str) -> float:
+    try:
+        return float(value[:-2])
+    except ValueError:
+        return 0.0
+
+
+def parse_display(value: str | None) -> DisplayValue | None:
+    try:
+        return DisplayValue(value)
+    except ValueError:
+        return None
+
+
+def parse_vertical_align(value: str | None) -> VerticalAlign:
+    try:
+        return VerticalAlign(value)
+    except ValueError:
+        return VerticalAlign.BASELINE
+
+
+def parse_font_key(family: str, size: str, weight: str, style: str) -> FontKey:
+    # only support family for now (not serif)
+    family = family.split(",")[0].strip('"' + "'")
+    # baked in euro-centrism :-)
+    if style == "normal":
+        style = "roman"
+    # assumes pixels
+    try:
+        points = int(float(size[:-2]) * 0.75)
+    except ValueError:
+        print("Unable to parse font size", size)
+        points = DEFAULT_FONT_SIZE_PX
+    return (family, points, weight, style)
@@ -0,0 +1,40 @@
+import unittest
+
+from css_values import (
+    BLACK,
+    parse_background_color,
+    parse_color,
+    parse_font_key,
+    parse_pixels,
+)
+
+
+class TestCSSValues(unittest.TestCase):
+    def test_parse_color(self):
+        self.assertEqual(parse_color("black"), BLACK)
+        self.assertEqual(parse_color("#f00"), 0xFFFF0000)
+        self.assertEqual(parse_color("#00ff0080"), 0x8000FF00)
+        self.assertIsNone(parse_color("#zzz"))
+        self.assertIsNone(parse_color("#12345"))
+        self.assertIsNone(parse_color("transparent"))
+
+    def test_background_color_prefers_background_color(self):
+        self.assertEqual(parse_background_color("red", "blue"), 0xFF0000FF)
+        self.assertEqual(parse_background_color("red 10px", None), 0xFFFF0000)
+        # only the last layer has a color
+        self.assertIsNone(parse_background_color("red, none", None))
+        self.assertIsNone(parse_background_color("", None))
+
+    def test_parse_pixels(self):
+        self.assertEqual(parse_pixels("120px"), 120)
+        self.assertIsNone(parse_pixels("50%"))
+
+    def test_parse_font_key(self):
+        self.assertEqual(
+            parse_font_key('"Helvetica", sans', "16px", "bold", "italic"),
+            ("Helvetica", 12, "bold", "italic"),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
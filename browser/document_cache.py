@@ -0,0 +1,84 @@
+import hashlib
+from concurrent.futures import Executor, Future
+from dom_serializer import deserialize, serialize
+from html_parser import Node
+from lru import LRUCache
+from parser_backends import DEFAULT_PARSER_BACKEND, get_parser_backend
+
+DOCUMENT_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+
+def body_digest(body: str) -> str:
+    return hashlib.blake2b(body.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def cache_key(body: str, backend: str) -> str:
+    # backends may disagree on broken markup, don't mix their trees
+    return f"{backend}:{body_digest(body)}"
+
+
+def parse_serialized(body: str, backend: str) -> bytes:
+    """Parses body and returns the encoded tree, runs in worker processes"""
+    return serialize(get_parser_backend(backend).parse(body))
+
+
+class PendingParse:
+    """A document being parsed in a worker process"""
+
+    def __init__(self, cache: "DocumentCache", body: str, backend: str, future: Future):
+        self.cache = cache
+        self.body = body
+        self.backend = backend
+        self.future = future
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def result(self) -> Node:
+        """Waits for the worker and returns the tree, caching its encoding"""
+        try:
+            data = self.future.result()
+        except Exception as e:
+            print("Parse worker failed, parsing inline", e)
+            return self.cache.parse(self.body, self.backend)
+        self.cache.trees.put(cache_key(self.body, self.backend), data, len(data))
+        return deserialize(data)
+
+    def cancel(self):
+        self.future.cancel()
+
+
+class DocumentCache:
+    """Caches parsed documents by the digest of their source
+
+    Trees are kept in their compact serialized form, so every hit decodes a
+    fresh tree the caller can style and mutate.
+    """
+
+    def __init__(self, max_bytes: int = DOCUMENT_CACHE_MAX_BYTES):
+        self.trees = LRUCache(max_bytes)
+
+    def contains(self, body: str, backend: str = DEFAULT_PARSER_BACKEND) -> bool:
+        return cache_key(body, backend) in self.trees
+
+    def parse(self, body: str, backend: str = DEFAULT_PARSER_BACKEND) -> Node:
+        key = cache_key(body, backend)
+        cached = self.trees.get(key)
+        if cached is not None:
+            return deserialize(cached)
+        tree = get_parser_backend(backend).parse(body)
+        data = serialize(tree)
+        self.trees.put(key, data, len(data))
+        return tree
+
+    def parse_in_worker(
+        self, body: str, pool: Executor, backend: str = DEFAULT_PARSER_BACKEND
+    ) -> PendingParse:
+        future = pool.submit(parse_serialized, body, backend)
+        return PendingParse(self, body, backend, future)
+
+    def stats(self) -> dict[str, int]:
+        return self.trees.stats()
+
+
+DOCUMENT_CACHE = DocumentCache()
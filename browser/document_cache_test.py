@@ -0,0 +1,70 @@
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+from document_cache import DocumentCache
+from dom_serializer import serialize
+from html_parser import HTMLParser, Text
+from lru import LRUCache
+
+HTML = '<p class="text">hello <b>moto</b><input value="hi"></p>'
+
+
+class TestDocumentCache(unittest.TestCase):
+    def test_parse_returns_independent_trees(self):
+        cache = DocumentCache()
+        first = cache.parse(HTML)
+        first.children[0].children[0].attributes["class"] = "changed"
+        second = cache.parse(HTML)
+
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(second, HTMLParser(HTML).parse())
+        self.assertIsNot(first, second)
+
+    def test_evicts_least_recently_used(self):
+        tree_size = len(serialize(HTMLParser("<p>one</p>").parse()))
+        cache = DocumentCache(max_bytes=2 * tree_size + 1)
+        cache.parse("<p>one</p>")
+        cache.parse("<p>two</p>")
+        cache.parse("<p>one</p>")
+        cache.parse("<p>six</p>")
+
+        self.assertLessEqual(cache.stats()["size"], 2 * tree_size + 1)
+        self.assertEqual(cache.stats()["evictions"], 1)
+        paragraph = cache.parse("<p>one</p>").children[0].children[0]
+        self.assertEqual(paragraph.children, [Text(paragraph, "one")])
+        self.assertEqual(cache.stats()["hits"], 2)
+
+    def test_parse_in_worker(self):
+        cache = DocumentCache()
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            pending = cache.parse_in_worker(HTML, pool)
+            tree = pending.result()
+
+        self.assertTrue(pending.done())
+        self.assertEqual(tree, HTMLParser(HTML).parse())
+        self.assertEqual(tree.subtree_hash, HTMLParser(HTML).parse().subtree_hash)
+        self.assertTrue(cache.contains(HTML))
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_by_size(self):
+        cache = LRUCache(10)
+        cache.put("a", 1, 4)
+        cache.put("b", 2, 4)
+        cache.get("a")
+        cache.put("c", 3, 4)
+
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertEqual(cache.size, 8)
+
+    def test_skips_entries_bigger_than_cache(self):
+        cache = LRUCache(10)
+        cache.put("a", 1, 11)
+
+        self.assertNotIn("a", cache)
+        self.assertEqual(cache.size, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
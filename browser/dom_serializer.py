@@ -0,0 +1,200 @@
+"""Compact binary encoding of Element/Text trees
+
+Layout of an encoded tree, all integers are unsigned LEB128 varints:
+
+    magic         b"DOM1"
+    strings       count, then (byte length, utf-8 bytes) per string
+    nodes         per node in document order: (string index << 1) | is_element,
+                  followed by the child count for elements
+    attributes    per element in document order: attribute count, then
+                  (key index, value index) pairs
+
+Computed styles are not part of the encoding, subtree hashes are rebuilt
+while decoding.
+"""
+
+import gc
+from html_parser import Element, Node, Text
+
+MAGIC = b"DOM1"
+
+
+class DOMDecodingException(Exception):
+    pass
+
+
+def write_varint(out: bytearray, value: int):
+    while value > 0x7F:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data: bytes, i: int) -> tuple[int, int]:
+    """Reads one varint at i, returns it and the offset after it"""
+    value = shift = 0
+    while True:
+        if i >= len(data):
+            raise DOMDecodingException("Truncated DOM encoding")
+        byte = data[i]
+        i += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, i
+        shift += 7
+
+
+def read_varints(data: bytes) -> list[int]:
+    values = []
+    append = values.append
+    value = shift = 0
+    for byte in data:
+        if byte < 0x80:
+            append(value | byte << shift)
+            value = shift = 0
+        else:
+            value |= (byte & 0x7F) << shift
+            shift += 7
+    if shift:
+        raise DOMDecodingException("Truncated DOM encoding")
+    return values
+
+
+def serialize(tree: Node) -> bytes:
+    string_ids: dict[str, int] = {}
+    nodes = bytearray()
+    attributes = bytearray()
+
+    def string_id(s: str) -> int:
+        index = string_ids.get(s)
+        if index is None:
+            index = string_ids[s] = len(string_ids)
+        return index
+
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Text):
+            write_varint(nodes, string_id(node.text) << 1)
+            continue
+        write_varint(nodes, string_id(node.tag) << 1 | 1)
+        write_varint(nodes, len(node.children))
+        write_varint(attributes, len(node.attributes))
+        for key, value in node.attributes.items():
+            write_varint(attributes, string_id(key))
+            write_varint(attributes, string_id(value))
+        stack.extend(reversed(node.children))
+
+    out = bytearray(MAGIC)
+    write_varint(out, len(string_ids))
+    for s in string_ids:
+        encoded = s.encode("utf-8")
+        write_varint(out, len(encoded))
+        out += encoded
+    return bytes(out + nodes + attributes)
+
+
+def deserialize(data: bytes) -> Node:
+    if not data.startswith(MAGIC):
+        raise DOMDecodingException("Not a DOM encoding")
+    string_count, i = read_varint(data, len(MAGIC))
+    strings = []
+    for _ in range(string_count):
+        length, i = read_varint(data, i)
+        if i + length > len(data):
+            raise DOMDecodingException("Truncated DOM encoding")
+        strings.append(data[i : i + length].decode("utf-8"))
+        i += length
+    # everything after the string table is varints
+    values = read_varints(memoryview(data)[i:])
+
+    # only new objects get allocated here, collection passes just slow it down
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        root, elements, j = build_tree(values, strings)
+        for element in elements:
+            count = values[j]
+            j += 1
+            attributes = element.attributes
+            for k in range(j, j + 2 * count, 2):
+                attributes[strings[values[k]]] = strings[values[k + 1]]
+            j += 2 * count
+        if j != len(values):
+            raise DOMDecodingException("Trailing data after DOM encoding")
+        # children come after their parent in document order
+        for element in reversed(elements):
+            element.rehash()
+    except IndexError:
+        raise DOMDecodingException("Truncated DOM encoding")
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return root
+
+
+def build_tree(
+    values: list[int], strings: list[str]
+) -> tuple[Node, list[Element], int]:
+    """Builds the tree from the node section of the varints
+
+    Returns the root, the elements in document order and the index of the
+    attribute section.
+    """
+    header = values[0]
+    if not header & 1:
+        root = Text(None, strings[header >> 1])
+        root.rehash()
+        return root, [], 1
+    root = Element(None, strings[header >> 1], {})
+    elements = [root]
+    # open elements and how many of their children are still to be read
+    parents = [root]
+    remaining = [values[1]]
+    j = 2
+    while parents:
+        if not remaining[-1]:
+            parents.pop()
+            remaining.pop()
+            continue
+        remaining[-1] -= 1
+        parent = parents[-1]
+        header = values[j]
+        if header & 1:
+            node = Element(parent, strings[header >> 1], {})
+            elements.append(node)
+            parents.append(node)
+            remaining.append(values[j + 1])
+            j += 2
+        else:
+            node = Text(parent, strings[header >> 1])
+            node.rehash()
+            j += 1
+        parent.children.append(node)
+    return root, elements, j
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    from html_parser import HTMLParser, tree_to_list
+    from url import URL
+
+    if not len(sys.argv) > 1:
+        print("need a url!")
+    else:
+        _, body, _ = URL({}, sys.argv[1]).request()
+        start = time.perf_counter()
+        tree = HTMLParser(body).parse()
+        parse_time = time.perf_counter() - start
+        start = time.perf_counter()
+        data = serialize(tree)
+        encode_time = time.perf_counter() - start
+        start = time.perf_counter()
+        deserialize(data)
+        decode_time = time.perf_counter() - start
+        print(f"nodes: {len(tree_to_list(tree, []))}")
+        print(f"source: {len(body.encode('utf-8'))} bytes, encoded: {len(data)} bytes")
+        print(f"parse: {parse_time * 1000:.1f}ms")
+        print(f"encode: {encode_time * 1000:.1f}ms")
+        print(f"decode: {decode_time * 1000:.1f}ms ({parse_time / decode_time:.1f}x)")
@@ -0,0 +1,87 @@
+import unittest
+
+from dom_serializer import (
+    DOMDecodingException,
+    deserialize,
+    read_varints,
+    serialize,
+    write_varint,
+)
+from html_parser import Element, HTMLParser, Text, tree_to_list
+
+ROUND_TRIP_CASES = [
+    ("text only", "hello moto"),
+    ("nested tags", "<div><p>hi <b>there</b></p><p>bye</p></div>"),
+    (
+        "attributes",
+        '<a href="google.com" target="_blank">link</a><input value="" hidden>',
+    ),
+    ("head tags", "<title>Hi</title><link rel=stylesheet href=a.css><p>body</p>"),
+    ("unicode", "<p title='café'>— © \U0001f600</p>"),
+    ("many children", "<ul>" + "<li>item</li>" * 300 + "</ul>"),
+    ("long text", "<p>" + "lorem ipsum " * 200 + "</p>"),
+]
+
+
+def assert_same_tree(test: unittest.TestCase, first, second):
+    first_nodes = tree_to_list(first, [])
+    second_nodes = tree_to_list(second, [])
+    test.assertEqual(len(first_nodes), len(second_nodes))
+    for a, b in zip(first_nodes, second_nodes):
+        test.assertIs(type(a), type(b))
+        test.assertEqual(a.subtree_hash, b.subtree_hash)
+        if isinstance(a, Text):
+            test.assertEqual(a.text, b.text)
+        else:
+            test.assertEqual(a.tag, b.tag)
+            test.assertEqual(list(a.attributes.items()), list(b.attributes.items()))
+        if b.parent:
+            test.assertIn(b, b.parent.children)
+
+
+class TestDOMSerializer(unittest.TestCase):
+    def test_round_trip(self):
+        for title, html in ROUND_TRIP_CASES:
+            with self.subTest(title):
+                tree = HTMLParser(html).parse()
+                assert_same_tree(self, tree, deserialize(serialize(tree)))
+
+    def test_round_trip_single_nodes(self):
+        text = Text(None, "alone")
+        text.rehash()
+        element = Element(None, "br", {"class": "x"})
+        element.rehash()
+
+        assert_same_tree(self, text, deserialize(serialize(text)))
+        assert_same_tree(self, element, deserialize(serialize(element)))
+
+    def test_shares_repeated_strings(self):
+        few = serialize(HTMLParser("<ul>" + "<li>item</li>" * 10 + "</ul>").parse())
+        many = serialize(HTMLParser("<ul>" + "<li>item</li>" * 20 + "</ul>").parse())
+
+        # tag, child count, attribute count and text are one byte each
+        self.assertEqual(len(many) - len(few), 10 * 4)
+
+    def test_varints(self):
+        out = bytearray()
+        values = [0, 1, 127, 128, 300, 2**21, 2**35]
+        for value in values:
+            write_varint(out, value)
+
+        self.assertEqual(read_varints(bytes(out)), values)
+
+    def test_rejects_bad_input(self):
+        data = serialize(HTMLParser("<p>hi</p>").parse())
+        cases = [
+            ("bad magic", b"XXXX" + data[4:]),
+            ("truncated", data[:-1]),
+            ("trailing data", data + b"\x00"),
+        ]
+        for title, bad in cases:
+            with self.subTest(title):
+                with self.assertRaises(DOMDecodingException):
+                    deserialize(bad)
+
+
+if __name__ == "__main__":
+    unittest.main()
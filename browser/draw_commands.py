@@ -1,60 +1,23 @@
+import css_values
 import skia
+from collections.abc import Sequence
 from dataclasses import dataclass, field
+from fonts import FontRecord, font_record_of
 
-NAMED_COLORS = {
-    "black": "#000000",
-    "silver": "#c0c0c0",
-    "gray": "#808080",
-    "grey": "#808080",
-    "white": "#ffffff",
-    "maroon": "#800000",
-    "red": "#ff0000",
-    "purple": "#800080",
-    "fuchsia": "#ff00ff",
-    "green": "#008000",
-    "lime": "#00ff00",
-    "olive": "#808000",
-    "yellow": "#ffff00",
-    "navy": "#000080",
-    "blue": "#0000ff",
-    "teal": "#008080",
-    "aqua": "#00ffff",
-    "lightblue": "#add8e6",
-    "orange": "#ffa500",
-}
-
-
-def parse_color(color: str, default: skia.Color = skia.ColorBLACK) -> skia.Color:
-    if color.startswith("#"):
-        if len(color) == 9:
-            r = int(color[1:3], 16)
-            g = int(color[3:5], 16)
-            b = int(color[5:7], 16)
-            a = int(color[7:9], 16)
-            return skia.Color(r, g, b, a)
-        elif len(color) == 7:
-            r = int(color[1:3], 16)
-            g = int(color[3:5], 16)
-            b = int(color[5:7], 16)
-            return skia.Color(r, g, b)
-        elif len(color) == 4:
-            r = int(color[1] * 2, 16)
-            g = int(color[2] * 2, 16)
-            b = int(color[3] * 2, 16)
-            return skia.Color(r, g, b)
-        else:
-            print("could not parse color", color)
-            return default
-    elif color in NAMED_COLORS:
-        return parse_color(NAMED_COLORS[color])
-    else:
-        print("missing color", color)
+
+def parse_color(color: str | int, default: skia.Color = skia.ColorBLACK) -> skia.Color:
+    # computed styles hold colors already packed
+    if isinstance(color, int):
+        return color
+    packed = css_values.parse_color(color)
+    if packed is None:
+        print("could not parse color", color)
         return default
+    return packed
 
 
 def get_font_linespace(font: skia.Font) -> int:
-    metrics = font.getMetrics()
-    return metrics.fDescent - metrics.fAscent
+    return font_record_of(font).linespace
 
 
 @dataclass
@@ -118,13 +81,19 @@ class DrawImage(DrawObject):
 class DrawText(DrawObject):
     text: str
     font: skia.Font
-    color: str
+    color: str | int
+    # saves measuring text again when layout already has
+    width: float = field(kw_only=True, default=None)
     bottom: int = field(init=False)
+    font_record: FontRecord = field(init=False, repr=False)
 
     def __post_init__(self):
-        self.bottom = self.y1 + get_font_linespace(self.font)
+        self.font_record = font_record_of(self.font)
+        if self.width is None:
+            self.width = self.font.measureText(self.text)
+        self.bottom = self.y1 + self.font_record.linespace
         self.rect = skia.Rect.MakeLTRB(
-            self.x1, self.y1, self.x1 + self.font.measureText(self.text), self.bottom
+            self.x1, self.y1, self.x1 + self.width, self.bottom
         )
 
     def execute(self, canvas):
@@ -132,13 +101,46 @@ class DrawText(DrawObject):
             AntiAlias=True,
             Color=parse_color(self.color),
         )
-        baseline = self.y1 - self.font.getMetrics().fAscent
+        baseline = self.y1 + self.font_record.ascent
         canvas.drawString(self.text, float(self.x1), baseline, self.font, paint)
 
 
+@dataclass()
+class DrawTextBlob(DrawObject):
+    """Draws a blob of positioned text at once, its origin at x1, y1"""
+
+    blob: skia.TextBlob
+    font: skia.Font
+    color: str | int
+    # where the blob's words are in their source text, kept by reference
+    source: str = field(kw_only=True, default="")
+    starts: Sequence[int] = field(kw_only=True, default=())
+    ends: Sequence[int] = field(kw_only=True, default=())
+    width: float = field(kw_only=True)
+    bottom: int = field(init=False)
+
+    def __post_init__(self):
+        self.bottom = self.y1 + get_font_linespace(self.font)
+        self.rect = skia.Rect.MakeLTRB(
+            self.x1, self.y1, self.x1 + self.width, self.bottom
+        )
+
+    def execute(self, canvas):
+        paint = skia.Paint(
+            AntiAlias=True,
+            Color=parse_color(self.color),
+        )
+        canvas.drawTextBlob(self.blob, float(self.x1), float(self.y1), paint)
+
+    @property
+    def text(self) -> str:
+        """The blob's words, joined only when asked, for debugging and tests"""
+        return " ".join(self.source[s:e] for s, e in zip(self.starts, self.ends))
+
+
 @dataclass()
 class DrawRect(DrawObject):
-    color: str
+    color: str | int
 
     def execute(self, canvas):
         paint = skia.Paint(Color=parse_color(self.color))
@@ -147,7 +149,7 @@ class DrawRect(DrawObject):
 
 @dataclass()
 class DrawRRect(DrawObject):
-    color: str
+    color: str | int
     radius: int
     rrect: skia.RRect = field(init=False)
 
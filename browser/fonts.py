@@ -0,0 +1,69 @@
+import skia
+from css_values import FontKey
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class FontRecord:
+    """A Skia font with the metrics layout and paint keep asking for
+
+    ascent and descent are distances from the baseline, both positive.
+    """
+
+    font: skia.Font
+    ascent: float
+    descent: float
+    linespace: float
+    space_width: float
+
+
+# one record per font key, shared by every tab
+FONT_CACHE: dict[FontKey, FontRecord] = {}
+# the same records by id of their font, for code that only has the font
+FONT_RECORDS_BY_FONT: dict[int, FontRecord] = {}
+
+
+def make_font_record(font: skia.Font) -> FontRecord:
+    metrics = font.getMetrics()
+    return FontRecord(
+        font,
+        -metrics.fAscent,
+        metrics.fDescent,
+        metrics.fDescent - metrics.fAscent,
+        font.measureText(" "),
+    )
+
+
+def get_font_record(font_key: FontKey) -> FontRecord:
+    record = FONT_CACHE.get(font_key)
+    if record is None:
+        font_family, size, weight, font_style = font_key
+        if weight == "bold":
+            skia_weight = skia.FontStyle.kBold_Weight
+        else:
+            skia_weight = skia.FontStyle.kNormal_Weight
+        if font_style == "italic":
+            skia_style = skia.FontStyle.kItalic_Slant
+        else:
+            skia_style = skia.FontStyle.kUpright_Slant
+        skia_width = skia.FontStyle.kNormal_Width
+        style_info = skia.FontStyle(skia_weight, skia_width, skia_style)
+        typeface = skia.Typeface(font_family, style_info)
+        record = make_font_record(skia.Font(typeface, size))
+        FONT_CACHE[font_key] = record
+        # cached fonts live for good, so their ids are never reused
+        FONT_RECORDS_BY_FONT[id(record.font)] = record
+    return record
+
+
+def get_font(font_family: str, size: int, weight: str, font_style: str) -> skia.Font:
+    """The shared font for these arguments, callers must not change it"""
+    return get_font_record((font_family, size, weight, font_style)).font
+
+
+def font_record_of(font: skia.Font) -> FontRecord:
+    """The cached record of font, or a new one for fonts made elsewhere"""
+    record = FONT_RECORDS_BY_FONT.get(id(font))
+    if record is None:
+        return make_font_record(font)
+    return record
@@ -0,0 +1,33 @@
+import skia
+import unittest
+
+from fonts import font_record_of, get_font, get_font_record
+
+FONT_KEY = ("Times", 12, "bold", "italic")
+
+
+class TestFontCache(unittest.TestCase):
+    def test_records_are_shared(self):
+        record = get_font_record(FONT_KEY)
+        self.assertIs(get_font_record(FONT_KEY), record)
+        self.assertIs(get_font(*FONT_KEY), record.font)
+        self.assertIs(font_record_of(record.font), record)
+
+    def test_record_holds_font_metrics(self):
+        record = get_font_record(FONT_KEY)
+        metrics = record.font.getMetrics()
+        self.assertEqual(record.ascent, -metrics.fAscent)
+        self.assertEqual(record.descent, metrics.fDescent)
+        self.assertEqual(record.linespace, metrics.fDescent - metrics.fAscent)
+        self.assertEqual(record.space_width, record.font.measureText(" "))
+        self.assertGreater(record.ascent, 0)
+
+    def test_record_of_uncached_font(self):
+        font = skia.Font(skia.Typeface("Times"), 30)
+        record = font_record_of(font)
+        self.assertIs(record.font, font)
+        self.assertGreater(record.linespace, get_font_record(FONT_KEY).linespace)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,25 +1,43 @@
+import html.entities
+import re
+from computed_style import ComputedStyle
 from dataclasses import dataclass, field
 from url import URL
 
-END_CHARACTER_REF = ["<", ">", " ", "\n"]
-CHARACTER_REF_MAP = {
-    "amp": "&",
-    "lt": "<",
-    "gt": ">",
-    "quot": '"',
-    "apos": "'",
-    "nbsp": " ",
-    "ndash": "–",
-    "mdash": "—",
-    "copy": "©",
-    "reg": "®",
-    "trade": "™",
-    "asymp": "≈",
-    "ne": "≠",
-    "pound": "£",
-    "euro": "€",
-    "deg": "°",
+# value key in CHARACTER_REF_TRIE nodes, never a character of a name
+CHARACTER_REF_VALUE = ""
+# windows-1252 meanings of C1 control numeric references, per the HTML spec
+NUMERIC_REF_REPLACEMENTS = {
+    0x80: "\u20ac",
+    0x82: "\u201a",
+    0x83: "\u0192",
+    0x84: "\u201e",
+    0x85: "\u2026",
+    0x86: "\u2020",
+    0x87: "\u2021",
+    0x88: "\u02c6",
+    0x89: "\u2030",
+    0x8A: "\u0160",
+    0x8B: "\u2039",
+    0x8C: "\u0152",
+    0x8E: "\u017d",
+    0x91: "\u2018",
+    0x92: "\u2019",
+    0x93: "\u201c",
+    0x94: "\u201d",
+    0x95: "\u2022",
+    0x96: "\u2013",
+    0x97: "\u2014",
+    0x98: "\u02dc",
+    0x99: "\u2122",
+    0x9A: "\u0161",
+    0x9B: "\u203a",
+    0x9C: "\u0153",
+    0x9E: "\u017e",
+    0x9F: "\u0178",
 }
+NUMERIC_REF_REGEX = re.compile(r"#(?:[xX]([0-9a-fA-F]+)|([0-9]+));?")
+TEXT_RUN_REGEX = re.compile(r"[^<&]+")
 SELF_CLOSING_TAGS = [
     "area",
     "base",
@@ -47,20 +65,43 @@ HEAD_TAGS = [
     "style",
     "script",
 ]
+TEXT_HASH_KEY = "#text"
+# attributes that hide an element from layout, see BlockLayout
+LAYOUT_ATTRIBUTES = {"hidden", "type"}
+# tag of the blocks layout wraps runs of inline children in
+ANON_BLOCK_TAG = "_anon_"
 
 
 @dataclass()
 class Node:
     children: list["Node"] = field(kw_only=True, default_factory=list)
     style: dict[str, str] = field(kw_only=True, default_factory=dict)
+    # structural (merkle) hash of the subtree, None until computed
+    subtree_hash: int | None = field(kw_only=True, default=None)
+    # restyle this node, some descendant, or the whole subtree; new nodes
+    # have never been styled
+    dirty_style: bool = field(kw_only=True, default=True)
+    dirty_children: bool = field(kw_only=True, default=False)
+    dirty_inherited: bool = field(kw_only=True, default=True)
+    # rebuild this node's boxes, or look for a descendant's; like the style
+    # flags, new nodes have never been laid out
+    dirty_layout: bool = field(kw_only=True, default=True)
+    dirty_layout_children: bool = field(kw_only=True, default=False)
     parent: "Node"
 
     def __eq__(self, other: object) -> bool:
         """Check equality
 
-        Checks whether children, styles are equal
+        Checks whether children, styles are equal. Nodes that both have a
+        subtree hash are known to differ when the hashes do.
         """
         if isinstance(other, Node):
+            if (
+                self.subtree_hash is not None
+                and other.subtree_hash is not None
+                and self.subtree_hash != other.subtree_hash
+            ):
+                return False
             return self.children == other.children and all(
                 [
                     key in other.style and other.style[key] == value
@@ -72,6 +113,12 @@ class Node:
     def __repr__(self):
         return f"style:{repr(self.style)} children:{repr(self.children)}"
 
+    def needs_restyle(self) -> bool:
+        return self.dirty_style or self.dirty_children or self.dirty_inherited
+
+    def needs_layout(self) -> bool:
+        return self.dirty_layout or self.dirty_layout_children
+
 
 @dataclass()
 class Text(Node):
@@ -81,6 +128,9 @@ class Text(Node):
     def __repr__(self):
         return f"<Text: {repr(self.text)} {super().__repr__()}>"
 
+    def rehash(self):
+        self.subtree_hash = hash((TEXT_HASH_KEY, self.text))
+
     def __eq__(self, other: object) -> bool:
         is_eq = super().__eq__(other)
         if is_eq:
@@ -92,8 +142,19 @@ class Text(Node):
 class Element(Node):
     tag: str
     attributes: dict[str, str]
+    # the class attribute classes() last split, and its classes
+    class_value: str = field(kw_only=True, default="", repr=False)
+    class_set: frozenset[str] = field(kw_only=True, default=frozenset(), repr=False)
     is_focused = False
 
+    def classes(self) -> frozenset[str]:
+        """The classes in the class attribute, split once per value"""
+        value = self.attributes.get("class", "")
+        if value is not self.class_value:
+            self.class_set = frozenset(value.split())
+            self.class_value = value
+        return self.class_set
+
     def __repr__(self):
         return (
             f"<Element: {self.tag} {super().__repr__()} attr:{repr(self.attributes)}>"
@@ -113,16 +174,87 @@ class Element(Node):
     def __hash__(self):
         return hash((id(self)))
 
+    def rehash(self):
+        """Computes subtree_hash from the tag, attributes and child hashes
+
+        Children are expected to be hashed already.
+        """
+        self.subtree_hash = hash(
+            (
+                self.tag,
+                frozenset(self.attributes.items()),
+                tuple(child.subtree_hash for child in self.children),
+            )
+        )
+
+    def set_attribute(self, name: str, value: str):
+        self.attributes[name] = value
+        update_subtree_hashes(self)
+        # selectors only see tags and classes, other attributes keep the style
+        if name == "style":
+            mark_style_dirty(self)
+        elif name == "class":
+            mark_style_dirty(self, subtree=True)
+        # these decide whether the parent lays the element out at all; style
+        # changes reach layout through restyle, and values are only painted
+        elif name in LAYOUT_ATTRIBUTES:
+            mark_layout_dirty(self)
+
+
+def update_subtree_hashes(node: Node):
+    """Rehashes node and its ancestors after node or its children changed"""
+    while node:
+        node.rehash()
+        node = node.parent
+
+
+def mark_style_dirty(node: Node, subtree: bool = False):
+    """Flags node for restyling, and its ancestors so restyle can find it
+
+    subtree restyles every descendant too, for changes that selectors
+    matching below node can see.
+    """
+    node.dirty_style = True
+    node.dirty_inherited = node.dirty_inherited or subtree
+    parent = node.parent
+    # ancestors above a flagged one are flagged already
+    while parent and not parent.dirty_children:
+        parent.dirty_children = True
+        parent = parent.parent
+
+
+def mark_layout_dirty(node: Node):
+    """Flags node's boxes for rebuilding, and its ancestors so layout finds it"""
+    node.dirty_layout = True
+    parent = node.parent
+    while parent and not parent.dirty_layout_children:
+        parent.dirty_layout_children = True
+        parent = parent.parent
+
+
+def clear_layout_dirty(node: Node):
+    """Marks a subtree laid out, for subtrees layout skips over"""
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        node.dirty_layout = node.dirty_layout_children = False
+        stack.extend(node.children)
+
 
 def create_anon_block(parent: Node, style: dict[str, str], children: list[Node]):
-    style["display"] = "block"
-    return Element(parent, "_anon_", {}, children=children, style=style)
+    # copy, the parent's computed style can be shared with other nodes
+    if isinstance(style, ComputedStyle):
+        style = style.with_values({"display": "block"})
+    else:
+        style = {**style, "display": "block"}
+    return Element(parent, ANON_BLOCK_TAG, {}, children=children, style=style)
 
 
 class HTMLParser:
     def __init__(self, body):
         self.body = body
         self.unfinished = []
+        self.fragment_context = None
 
     def add_text(self, text):
         if text.isspace():
@@ -130,6 +262,7 @@ class HTMLParser:
         self.add_missing_tags()
         parent = self.unfinished[-1] if self.unfinished else None
         node = Text(parent, text)
+        node.rehash()
         if parent:
             parent.children.append(node)
 
@@ -137,17 +270,23 @@ class HTMLParser:
         tag, attributes = get_tag_attributes(text)
         if tag.startswith("!"):
             return
+        self.add_element(tag, attributes)
+
+    def add_element(self, tag: str, attributes: dict[str, str]):
+        """Opens (or closes, for "/tag") an element in the tree being built"""
         self.add_missing_tags(tag)
         if tag.startswith("/"):
             if len(self.unfinished) == 1:
                 return
             node = self.unfinished.pop()
+            node.rehash()
             parent = self.unfinished[-1]
             parent.children.append(node)
         elif tag in SELF_CLOSING_TAGS:
             # what if we start wit a self closing tag?
             parent = self.unfinished[-1]
             node = Element(parent, tag, attributes)
+            node.rehash()
             parent.children.append(node)
         else:
             parent = self.unfinished[-1] if self.unfinished else None
@@ -155,16 +294,26 @@ class HTMLParser:
             self.unfinished.append(node)
 
     def finish(self):
+        # an empty body still gets its html/body tags
+        if not self.unfinished:
+            self.add_missing_tags()
         while len(self.unfinished) > 1:
             node = self.unfinished.pop()
+            node.rehash()
             parent = self.unfinished[-1]
             parent.children.append(node)
-        return self.unfinished.pop()
+        root = self.unfinished.pop()
+        root.rehash()
+        return root
 
     def add_missing_tags(self, current_tag=None):
         """Adds missing tags. Called implicit_tags in book."""
+        # fragments already live inside a document
+        if self.fragment_context:
+            return
         while True:
-            open_tags = [node.tag for node in self.unfinished]
+            # only the first two open tags matter, don't copy a deep stack
+            open_tags = [node.tag for node in self.unfinished[:3]]
             # First tag needs to be HTML
             if not open_tags and current_tag != "html":
                 self.add_tag("html")
@@ -184,54 +333,99 @@ class HTMLParser:
                 break
 
     def parse(self):
-        in_tag = False
-        in_character_reference = False
-        saved_chars = ""
-        for c in self.body:
-            if in_character_reference and c in END_CHARACTER_REF:
-                in_character_reference = False
-                self.add_text(f"&{saved_chars}")
-                saved_chars = ""
-            if in_tag:
-                if c == ">":
-                    in_tag = False
-                    self.add_tag(saved_chars)
-                    saved_chars = ""
-                else:
-                    saved_chars += c
-            elif in_character_reference:
-                if c == ";":
-                    in_character_reference = False
-                    has_reference = saved_chars in CHARACTER_REF_MAP
-                    self.add_text(
-                        CHARACTER_REF_MAP[saved_chars]
-                        if has_reference
-                        else f"&{saved_chars};"
-                    )
-                    saved_chars = ""
-                else:
-                    saved_chars += c
-            elif c == "<":
-                in_tag = True
-                if saved_chars:
-                    self.add_text(saved_chars)
-                saved_chars = ""
+        body = self.body
+        i = 0
+        # text between tags, character references decode into it
+        text_run = []
+        while i < len(body):
+            c = body[i]
+            if c == "<":
+                end = body.find(">", i + 1)
+                if end == -1:
+                    # browsers drop a tag cut off by the end of input ("<b>hi</b")
+                    if i + 1 == len(body):
+                        text_run.append("<")
+                    break
+                if text_run:
+                    self.add_text("".join(text_run))
+                    text_run = []
+                self.add_tag(body[i + 1 : end])
+                i = end + 1
             elif c == "&":
-                in_character_reference = True
-                if saved_chars:
-                    self.add_text(saved_chars)
-                saved_chars = ""
+                decoded, i = decode_character_reference(body, i)
+                text_run.append(decoded)
             else:
-                saved_chars += c
-        # if we end while saving characters, spit them out
-        if in_character_reference:
-            self.add_text("&")
-        elif in_tag:
-            self.add_text("<")
-        if saved_chars:
-            self.add_text(saved_chars)
+                match = TEXT_RUN_REGEX.match(body, i)
+                text_run.append(match.group())
+                i = match.end()
+        if text_run:
+            self.add_text("".join(text_run))
         return self.finish()
 
+    def parse_fragment(self, context: Element) -> list[Node]:
+        """Parses the body as the contents of context (like innerHTML)
+
+        Skips the implicit html/head/body tags and returns the top level
+        nodes already parented to context.
+        """
+        self.fragment_context = context
+        self.unfinished = [Element(None, context.tag, {})]
+        root = self.parse()
+        for child in root.children:
+            child.parent = context
+        return root.children
+
+
+def build_character_ref_trie() -> dict:
+    """Builds a trie of the HTML5 named character references
+
+    Names are stored with and without their ';' where the spec allows
+    leaving it off, so the deepest value found is the longest match.
+    """
+    trie = {}
+    for name, value in html.entities.html5.items():
+        node = trie
+        for c in name:
+            node = node.setdefault(c, {})
+        node[CHARACTER_REF_VALUE] = value
+    return trie
+
+
+CHARACTER_REF_TRIE = build_character_ref_trie()
+
+
+def decode_character_reference(body: str, start: int) -> tuple[str, int]:
+    """Decodes the character reference at the "&" at start
+
+    Returns the decoded text and the index after the reference. An "&" that
+    doesn't start a known reference decodes to itself.
+    """
+    if body.startswith("#", start + 1):
+        match = NUMERIC_REF_REGEX.match(body, start + 1)
+        if not match:
+            return "&", start + 1
+        hex_digits, digits = match.groups()
+        code = int(hex_digits, 16) if hex_digits else int(digits)
+        if code in NUMERIC_REF_REPLACEMENTS:
+            decoded = NUMERIC_REF_REPLACEMENTS[code]
+        elif code == 0 or code > 0x10FFFF or 0xD800 <= code <= 0xDFFF:
+            decoded = "\ufffd"
+        else:
+            decoded = chr(code)
+        return decoded, match.end()
+    # walk the trie as far as the name goes, remembering the longest match
+    node = CHARACTER_REF_TRIE
+    decoded, end = "&", start + 1
+    i = start + 1
+    while i < len(body):
+        node = node.get(body[i])
+        if node is None:
+            break
+        i += 1
+        if CHARACTER_REF_VALUE in node:
+            decoded, end = node[CHARACTER_REF_VALUE], i
+    return decoded, end
+
 
 def get_tag_attributes(text: str) -> tuple[str, dict[str, str]]:
     parts = text.split(None, 1)
@@ -275,15 +469,24 @@ def get_tag_attributes(text: str) -> tuple[str, dict[str, str]]:
 
 
 def print_tree(node, indent=0):
-    print(" " * indent, node)
-    for child in node.children:
-        print_tree(child, indent + 2)
+    stack = [(node, indent)]
+    while stack:
+        node, indent = stack.pop()
+        print(" " * indent, node)
+        stack.extend((child, indent + 2) for child in reversed(node.children))
 
 
 def tree_to_list(tree: Node, list: list[Node]) -> list[Node]:
-    list.append(tree)
-    for child in tree.children:
-        tree_to_list(child, list)
+    """Appends tree and its descendants to list in document order
+
+    Works on anything with children, layout trees too. Loops instead of
+    recursing, so deep trees don't hit the recursion limit.
+    """
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        list.append(node)
+        stack.extend(reversed(node.children))
     return list
 
 
@@ -6,7 +6,9 @@ from html_parser import (
     Text,
     get_tag_attributes,
     create_anon_block,
+    decode_character_reference,
     tree_to_list,
+    update_subtree_hashes,
 )
 
 
@@ -45,6 +47,23 @@ TAG_ATTRIBUTES_CASES = [
     ),
 ]
 
+CHARACTER_REF_CASES = [
+    ("named", "&lt;b", ("<", 4)),
+    ("full table", "&hearts;", ("\u2665", 8)),
+    ("legacy without semicolon", "&copy 2024", ("\xa9", 5)),
+    ("longest match", "&notin;", ("\u2209", 7)),
+    ("longest legacy prefix", "&notit;", ("\xac", 4)),
+    ("unknown name", "&george;", ("&", 1)),
+    ("decimal", "&#65;", ("A", 5)),
+    ("hex", "&#x2014;", ("\u2014", 8)),
+    ("numeric without semicolon", "&#X41 ", ("A", 5)),
+    ("windows-1252 control", "&#150;", ("\u2013", 6)),
+    ("null", "&#0;", ("\ufffd", 4)),
+    ("out of range", "&#x110000;", ("\ufffd", 10)),
+    ("no digits", "&#;", ("&", 1)),
+    ("ampersand at end", "&", ("&", 1)),
+]
+
 
 class TestHTMLParser(unittest.TestCase):
     def setUp(self):
@@ -104,22 +123,36 @@ class TestHTMLParser(unittest.TestCase):
 
     def test_parse_almost_character_ref(self):
         html = "&gtclose panda"
-        text_node_one = Text(self.body_node, "&gtclose")
-        text_node_two = Text(self.body_node, " panda")
-        self.body_node.children = [text_node_one, text_node_two]
+        # legacy references like &gt may leave off the semicolon
+        text_node = Text(self.body_node, ">close panda")
+        self.body_node.children = [text_node]
+
+        parsed = HTMLParser(html).parse()
+        self.assertEqual(parsed, self.html_node)
+
+    def test_parse_unknown_character_ref(self):
+        html = "&george; and &<b>x</b>&"
+        text_node = Text(self.body_node, "&george; and &")
+        b_node = Element(self.body_node, "b", {})
+        b_node.children = [Text(b_node, "x")]
+        self.body_node.children = [text_node, b_node, Text(self.body_node, "&")]
 
         parsed = HTMLParser(html).parse()
         self.assertEqual(parsed, self.html_node)
 
-    def test_parse_almost_character_ref_at_end(self):
-        html = "&gtclose"
-        text_node_one = Text(self.body_node, "&")
-        text_node_two = Text(self.body_node, "gtclose")
-        self.body_node.children = [text_node_one, text_node_two]
+    def test_parse_character_ref_in_text_run(self):
+        html = "AT&amp;T &copy; 2024"
+        text_node = Text(self.body_node, "AT&T © 2024")
+        self.body_node.children = [text_node]
 
         parsed = HTMLParser(html).parse()
         self.assertEqual(parsed, self.html_node)
 
+    def test_decode_character_reference(self):
+        for title, text, ans in CHARACTER_REF_CASES:
+            with self.subTest(title):
+                self.assertEqual(decode_character_reference(text, 0), ans)
+
     def test_parse_self_closing_tags(self):
         html = "<input />hello"
         input_node = Element(self.body_node, "input", {})
@@ -129,12 +162,76 @@ class TestHTMLParser(unittest.TestCase):
         parsed = HTMLParser(html).parse()
         self.assertEqual(parsed, self.html_node)
 
+    def test_parse_fragment(self):
+        html = "<b>hi</b> there<link>"
+        b_node = Element(self.body_node, "b", {})
+        b_node.children = [Text(b_node, "hi")]
+        text_node = Text(self.body_node, " there")
+        link_node = Element(self.body_node, "link", {})
+
+        nodes = HTMLParser(html).parse_fragment(self.body_node)
+        self.assertEqual(nodes, [b_node, text_node, link_node])
+        self.assertTrue(all(node.parent is self.body_node for node in nodes))
+
+    def test_parse_fragment_drops_unfinished_tag(self):
+        b_node = Element(self.body_node, "b", {})
+        b_node.children = [Text(b_node, "hi")]
+
+        nodes = HTMLParser("<b>hi</b").parse_fragment(self.body_node)
+        self.assertEqual(nodes, [b_node])
+
+    def test_subtree_hash_matches_identical_documents(self):
+        html = '<p class="text">hello <b>moto</b></p>'
+
+        self.assertEqual(
+            HTMLParser(html).parse().subtree_hash,
+            HTMLParser(html).parse().subtree_hash,
+        )
+        self.assertNotEqual(
+            HTMLParser(html).parse().subtree_hash,
+            HTMLParser(html.replace("moto", "razr")).parse().subtree_hash,
+        )
+
+    def test_subtree_hash_short_circuits_equality(self):
+        first = HTMLParser("<p>hello</p>").parse()
+        second = HTMLParser("<p>hello</p>").parse()
+        second.subtree_hash += 1
+
+        self.assertNotEqual(first, second)
+
+    def test_update_subtree_hashes(self):
+        doc = HTMLParser("<p><input value=a></p><p>hi</p>").parse()
+        input_node = doc.children[0].children[0].children[0]
+        sibling = doc.children[0].children[1]
+        doc_hash, sibling_hash = doc.subtree_hash, sibling.subtree_hash
+
+        input_node.set_attribute("value", "ab")
+
+        self.assertNotEqual(doc.subtree_hash, doc_hash)
+        self.assertEqual(sibling.subtree_hash, sibling_hash)
+        self.assertEqual(
+            doc.subtree_hash,
+            HTMLParser("<p><input value=ab></p><p>hi</p>").parse().subtree_hash,
+        )
+
+        input_node.attributes["value"] = "a"
+        update_subtree_hashes(input_node)
+        self.assertEqual(doc.subtree_hash, doc_hash)
+
     def test_create_anon_block(self):
         style = {"color": "red"}
         text_node = Text(self.body_node, "hello")
-        node = Element(self.body_node, "_anon_", {}, children=[text_node], style=style)
+        node = Element(
+            self.body_node,
+            "_anon_",
+            {},
+            children=[text_node],
+            style={"color": "red", "display": "block"},
+        )
 
         self.assertEqual(create_anon_block(self.body_node, style, [text_node]), node)
+        # the parent's style may be shared, it must not change
+        self.assertEqual(style, {"color": "red"})
 
     def test_tree_to_list(self):
         p_node = Element(self.body_node, "p", {"class": "text"})
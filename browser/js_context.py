@@ -1,7 +1,14 @@
 import dukpy
 from css_parser import CSSParser, SelectorParsingException
 from enum import Enum
-from html_parser import Element, HTMLParser, tree_to_list
+from html_parser import (
+    Element,
+    HTMLParser,
+    mark_layout_dirty,
+    mark_style_dirty,
+    tree_to_list,
+    update_subtree_hashes,
+)
 
 RUNTIME_JS_FILE = "runtime.js"
 RUNTIME_JS = open(RUNTIME_JS_FILE).read()
@@ -52,7 +59,7 @@ class JSContext:
             nodes = [
                 node
                 for node in tree_to_list(self.tab.nodes, [])
-                if selector.matches(node)
+                if selector.matcher(node)
             ]
             return [self.get_handle(node) for node in nodes]
         except SelectorParsingException as e:
@@ -65,12 +72,19 @@ class JSContext:
         return attr if attr else ""
 
     def innerHTML_set(self, handle: int, s: str):
-        doc = HTMLParser(f"<html><body>{s}</body></html>").parse()
-        new_nodes = doc.children[0].children
         elt = self.handle_to_node[handle]
+        new_nodes = HTMLParser(s).parse_fragment(elt)
+        # identical markup leaves the styled and laid out tree untouched
+        if [node.subtree_hash for node in new_nodes] == [
+            child.subtree_hash for child in elt.children
+        ]:
+            return
         elt.children = new_nodes
-        for child in elt.children:
-            child.parent = elt
+        update_subtree_hashes(elt)
+        # only the new children need styling, and elt's boxes rebuilding
+        for node in new_nodes:
+            mark_style_dirty(node)
+        mark_layout_dirty(elt)
         self.tab.render()
 
     def value_get(self, handle: int) -> str:
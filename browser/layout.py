@@ -1,91 +1,105 @@
+import bisect
+import itertools
 import re
 import skia
-from enum import Enum
-from html_parser import Node, Element, Text, create_anon_block
-from display_constants import DEFAULT_FONT_SIZE_PX, HSTEP, INPUT_WIDTH_PX, LEADING_FACTOR, POINTER_HOVER_TAG, WIDTH 
-from draw_commands import DrawRect, DrawRRect, DrawText, DrawObject, DrawOutline, DrawLine, get_font_linespace, parse_color
-
-
-PIXEL_VALUE_REGEX = r"(\d+)px"
-
-FONT_CACHE = {}
-
-def get_node_font(node: Node) -> skia.Font:
-    weight = node.style["font-weight"]
-    # only support family for now (not serif)
-    font_family = node.style["font-family"].split(",")[0].strip('"' + "'")
-    font_style = node.style["font-style"]
-    # baked in euro-centrism :-)
-    if font_style == "normal":
-        font_style = "roman"
-    # assumes pixels
-    try:
-        size = int(float(node.style["font-size"][:-2]) * 0.75)
-    except ValueError:
-        print("Unable to parse font size", node.style["font-size"])
-        size = DEFAULT_FONT_SIZE_PX 
-
-    return get_font(font_family, size, weight, font_style)
- 
-
-def get_font(font_family: str, size: int, weight: str, font_style: str) -> skia.Font:
-    key = (font_family, size, weight, font_style)
-    if key not in FONT_CACHE:
-        if weight == "bold":
-            skia_weight = skia.FontStyle.kBold_Weight
-        else:
-            skia_weight = skia.FontStyle.kNormal_Weight
-        if font_style == "italic":
-            skia_style = skia.FontStyle.kItalic_Slant
-        else:
-            skia_style = skia.FontStyle.kUpright_Slant
-        skia_width = skia.FontStyle.kNormal_Width
-        style_info = \
-            skia.FontStyle(skia_weight, skia_width, skia_style)
-        font = skia.Typeface(font_family, style_info)
-        FONT_CACHE[key] = font
-    return skia.Font(FONT_CACHE[key], size)
+from array import array
+from collections import Counter
+from css_values import DisplayValue, FontKey, VerticalAlign
+from html_parser import ANON_BLOCK_TAG, Node, Element, Text, clear_layout_dirty, create_anon_block
+from display_constants import HSTEP, INPUT_WIDTH_PX, LEADING_FACTOR, POINTER_HOVER_TAG, WIDTH 
+from draw_commands import DrawRect, DrawRRect, DrawText, DrawTextBlob, DrawObject, DrawOutline, DrawLine
+from fonts import FONT_CACHE, FontRecord, get_font, get_font_record
+from lru import LRUCache
+
+try:
+    import numpy
+except ImportError:
+    # prefix sums fall back to itertools
+    numpy = None
+
+# widths of recently measured words, shared by every tab
+TEXT_WIDTH_CACHE_SIZE = 65536
+TEXT_WIDTH_CACHE = LRUCache(TEXT_WIDTH_CACHE_SIZE)
+# calls into Skia by kind, text is only measured as whole runs
+MEASUREMENTS = Counter()
+WORD_REGEX = re.compile(r"\S+")
+
+def get_node_font_record(node: Node) -> FontRecord:
+    return get_font_record(node.style.font_key)
+
+
+def space_width(font_key: FontKey) -> float:
+    return get_font_record(font_key).space_width
+
+
+def glyph_prefix_widths(font_key: FontKey, text: str):
+    """Widths of text[:i] for each i, from one batch of glyph advances
+
+    Skia makes one glyph per code point, so glyph i is text[i].
+    """
+    MEASUREMENTS["runs"] += 1
+    font = get_font(*font_key)
+    advances = font.getWidths(font.textToGlyphs(text))
+    if numpy is not None:
+        prefix = numpy.zeros(len(advances) + 1)
+        numpy.cumsum(advances, out=prefix[1:])
+        return prefix
+    return list(itertools.accumulate(advances, initial=0.0))
+
+
+def shape_words(font_key: FontKey, text: str, spans: list[tuple[int, int]]) -> list[float]:
+    """Widths of the words of text at spans, measuring the whole text at once"""
+    if not spans:
+        return []
+    prefix = glyph_prefix_widths(font_key, text)
+    if numpy is not None:
+        starts, ends = numpy.array(spans).T
+        return (prefix[ends] - prefix[starts]).tolist()
+    return [prefix[end] - prefix[start] for start, end in spans]
+
+
+def measure_words(font_key: FontKey, text: str) -> tuple[list[tuple[int, int]], list[float]]:
+    """The start and end offsets of the words of text, and their widths
+
+    Cached widths are used when every word has one, otherwise the text is
+    measured in one batch and its words cached.
+    """
+    spans = [match.span() for match in WORD_REGEX.finditer(text)]
+    words = [text[start:end] for start, end in spans]
+    widths = [TEXT_WIDTH_CACHE.get((font_key, word)) for word in words]
+    if None in widths:
+        widths = shape_words(font_key, text, spans)
+        # bounded by the number of words, each counts as one
+        for word, width in zip(words, widths):
+            TEXT_WIDTH_CACHE.put((font_key, word), width, 1)
+    return spans, widths
+
+
+def text_measurement_stats() -> dict[str, int]:
+    """Width cache stats, with measurements counting the calls into Skia"""
+    stats = TEXT_WIDTH_CACHE.stats()
+    stats["fonts"] = len(FONT_CACHE)
+    stats["shaped_runs"] = MEASUREMENTS["runs"]
+    # each font measured its space once
+    stats["measurements"] = MEASUREMENTS.total() + len(FONT_CACHE)
+    return stats
 
 
 def is_inline_display(node: Node) -> bool:
-    return isinstance(node, Text) or node.style["display"] == DisplayValue.INLINE.value
+    return isinstance(node, Text) or node.style.display == DisplayValue.INLINE
 
 
 def draw_node_background(node: Node, x: int, width: int, y: int, height: int) -> list[DrawObject]:
     cmds = []
-    background = node.style.get("background", None)
-    bgcolor = ""
-    if background:
-        # background-color should be in the final layer
-        color_values = [ value
-                    for value in background.split(",")[-1].split(" ")
-                    if parse_color(value, None)
-                  ]
-        bgcolor = color_values[-1] if len(color_values) else ""
-    if "background-color" in node.style:
-        bgcolor = node.style.get("background-color")
-    if bgcolor:
+    bgcolor = node.style.background_color
+    if bgcolor is not None:
         x2, y2 = x + width, y + height
-        try:
-            radius = float(node.style.get("border-radius", "0px")[:-2])
-        except ValueError:
-            radius = 0.0
+        radius = node.style.border_radius
         rect = DrawRRect(bgcolor, radius, x1=x, y1=y, x2=x2, y2=y2)
         cmds.append(rect)
     return cmds
 
 
-class VerticalAlign(Enum):
-    BASELINE = "baseline"
-    SUB = "sub"
-    SUPER = "super"
-
-
-class DisplayValue(Enum):
-    BLOCK = "block"
-    INLINE = "inline"
-
-
 class DocumentLayout:
     def __init__(self, node):
         self.node = node
@@ -98,8 +112,10 @@ class DocumentLayout:
         self.height = None
 
     def layout(self):
-        child = BlockLayout(self.node, self, None)
-        self.children.append(child)
+        """Lays out the document, reusing the boxes of clean nodes"""
+        if not self.children:
+            self.children.append(BlockLayout(self.node, self, None))
+        child = self.children[0]
         self.width = WIDTH - 2 * HSTEP
         self.x = HSTEP
         self.y = 0
@@ -113,12 +129,39 @@ class DocumentLayout:
         return []
 
 
+def block_key(node: Node):
+    """Identifies the block of node across layouts"""
+    if node.tag == ANON_BLOCK_TAG:
+        return tuple(map(id, node.children))
+    return id(node)
+
+
+def is_hidden(node: Node) -> bool:
+    # hide the <head> tag
+    return isinstance(node, Element) and (
+        node.tag == "head"
+        or (
+            node.tag == "input"
+            and node.attributes.get("type", "") == "hidden"
+        )
+        or node.attributes.get("hidden", None) != None
+    )
+
+
 class BlockLayout:
+    """A block's box, kept across layouts
+
+    layout() rebuilds the children only when the node or a descendant is
+    dirty, or the block moved sideways or changed width. Otherwise the
+    block keeps its boxes and just shifts them to its new y.
+    """
+
     def __init__(self, node, parent, previous):
         self.node = node
         self.parent = parent
         self.previous = previous
         self.children = []
+        self.mode = None
         self.x = None
         self.y = None
         self.width = None
@@ -132,7 +175,7 @@ class BlockLayout:
         cmds = []
         cmds.extend(draw_node_background(
             self.node, self.x, self.width, self.y, self.height))
-        if self.layout_mode() == DisplayValue.INLINE:
+        if self.mode == DisplayValue.INLINE:
             for node in self.children:
                 cmds.extend(node.paint())
         return cmds
@@ -144,7 +187,7 @@ class BlockLayout:
         elif any(
             [
                 isinstance(child, Element)
-                and child.style["display"] == DisplayValue.BLOCK.value
+                and child.style.display == DisplayValue.BLOCK
                 for child in self.node.children
             ]
         ):
@@ -154,95 +197,146 @@ class BlockLayout:
         else:
             return DisplayValue.BLOCK
 
+    def needs_layout(self) -> bool:
+        if self.node.needs_layout():
+            return True
+        # anonymous blocks hold children of another node, which has the flags
+        return self.node.tag == ANON_BLOCK_TAG and any(
+            child.needs_layout() for child in self.node.children
+        )
+
+    def shift(self, dy):
+        stack = [self]
+        while stack:
+            box = stack.pop()
+            box.y += dy
+            stack.extend(box.children)
+
     def layout(self):
-        self.x = self.parent.x
-        match = re.search(PIXEL_VALUE_REGEX, self.node.style.get("width", ""))
-        if match:
-            self.width = int(match.group(1))
+        """Lays out this block and the blocks below it
+
+        Loops over the blocks instead of recursing, so deep trees don't hit
+        the recursion limit. Each block is placed and gets its children
+        before them, and is measured after them.
+        """
+        stack = [(self, False)]
+        while stack:
+            box, children_done = stack.pop()
+            if not isinstance(box, BlockLayout):
+                box.layout()
+            elif children_done:
+                box.finish_layout()
+            elif box.start_layout():
+                stack.append((box, True))
+                stack.extend((child, False) for child in reversed(box.children))
+
+    def start_layout(self) -> bool:
+        """Places the block and makes its children, False if it was clean"""
+        x = self.parent.x
+        if self.node.style.width is not None:
+            width = self.node.style.width
         else:
-            self.width = self.parent.width
+            width = self.parent.width
         if self.previous:
-            self.y = self.previous.y + self.previous.height
+            y = self.previous.y + self.previous.height
         else:
-            self.y = self.parent.y
-        mode = self.layout_mode()
-        if mode == DisplayValue.BLOCK:
-            previous = None
-            block_nodes_buffer = []
-            for child in self.node.children:
-                # hide the <head> tag
-                if isinstance(child, Element) and (
-                    child.tag == "head"
-                    or (
-                        child.tag == "input"
-                        and child.attributes.get("type", "") == "hidden"
-                    )
-                    or child.attributes.get("hidden", None) != None
-                ):
-
-                    continue
-                if is_inline_display(child):
-                    block_nodes_buffer.append(child)
-                    continue
-                elif block_nodes_buffer:
-                    anon_box = create_anon_block(
-                        self.node, self.node.style, block_nodes_buffer
-                    )
-                    previous = BlockLayout(anon_box, self, previous)
-                    self.children.append(previous)
-                    block_nodes_buffer = []
-
-                nxt = BlockLayout(child, self, previous)
-                self.children.append(nxt)
-                previous = nxt
-            if block_nodes_buffer:
-                anon_box = create_anon_block(
-                    self.node, self.node.style, block_nodes_buffer
-                )
-                nxt = BlockLayout(anon_box, self, previous)
-                self.children.append(nxt)
+            y = self.parent.y
+        if x == self.x and width == self.width and not self.needs_layout():
+            # only boxes above changed, follow them
+            if y != self.y:
+                self.shift(y - self.y)
+            return False
+        self.x, self.y, self.width = x, y, width
+        self.mode = self.layout_mode()
+        if self.mode == DisplayValue.BLOCK:
+            self.layout_blocks()
         else:
+            self.children = []
             self.new_line()
             self.recurse(self.node)
-        for child in self.children:
-            child.layout()
+        self.node.dirty_layout = self.node.dirty_layout_children = False
+        return True
 
-        match = re.search(PIXEL_VALUE_REGEX, self.node.style.get("height", ""))
+    def finish_layout(self):
         # override normal height with css
-        if match:
-            self.height = int(match.group(1))
+        if self.node.style.height is not None:
+            self.height = self.node.style.height
         else:
             self.height = sum([child.height for child in self.children])
 
+    def layout_blocks(self):
+        """Makes a block for each child, reusing the blocks of clean children"""
+        reusable = {}
+        # a changed node may be shown differently, its blocks start over
+        if not self.node.dirty_layout:
+            for child in self.children:
+                if isinstance(child, BlockLayout):
+                    reusable[block_key(child.node)] = child
+        self.children = []
+        block_nodes_buffer = []
+        for child in self.node.children:
+            if is_hidden(child):
+                clear_layout_dirty(child)
+                continue
+            if is_inline_display(child):
+                block_nodes_buffer.append(child)
+                continue
+            elif block_nodes_buffer:
+                self.add_anon_block(block_nodes_buffer, reusable)
+                block_nodes_buffer = []
+            self.add_child(reusable.get(id(child)) or BlockLayout(child, self, None))
+        if block_nodes_buffer:
+            self.add_anon_block(block_nodes_buffer, reusable)
+
+    def add_anon_block(self, nodes, reusable):
+        anon = reusable.get(tuple(map(id, nodes)))
+        if anon is None:
+            anon_box = create_anon_block(self.node, self.node.style, nodes)
+            anon = BlockLayout(anon_box, self, None)
+        self.add_child(anon)
+
+    def add_child(self, child):
+        child.parent = self
+        child.previous = self.children[-1] if self.children else None
+        self.children.append(child)
+
     def recurse(self, tree):
-        if isinstance(tree, Text):
-            for word in tree.text.split():
-                self.word(tree, word)
-        else:
-            if tree.tag == "br":
+        """Lays out the inline content of tree in document order"""
+        stack = [tree]
+        while stack:
+            tree = stack.pop()
+            tree.dirty_layout = tree.dirty_layout_children = False
+            if isinstance(tree, Text):
+                spans, widths = measure_words(tree.style.font_key, tree.text)
+                for (start, end), width in zip(spans, widths):
+                    self.word(tree, start, end, width)
+            elif tree.tag == "br":
+                clear_layout_dirty(tree)
                 self.new_line()
             elif tree.tag  in ["input", "button"]:
+                # their contents are painted, not laid out
+                clear_layout_dirty(tree)
                 self.input(tree)
             else:
-                for child in tree.children:
-                    self.recurse(child)
-
-    def word(self, node, word):
-        font = get_node_font(node)
-        text_width = font.measureText(word)
+                stack.extend(reversed(tree.children))
 
+    def word(self, node, start, end, text_width):
         # if there is no horizontal space, write current line
         if self.cursor_x + text_width > self.width:
             self.new_line()
 
         line = self.children[-1]
         previous_word = line.children[-1] if line.children else None
-        text = TextLayout(node, word, line, previous_word)
-        line.children.append(text)
+        # words of the same node on a line share a run
+        run = previous_word
+        if not isinstance(run, TextRunLayout) or run.node is not node:
+            run = TextRunLayout(node, line, previous_word)
+            line.children.append(run)
+        run.add_word(start, end, text_width)
         self.cursor_x += text_width
         # we should think about when to add a space
         if previous_word:
-            self.cursor_x += font.measureText(" ")
+            self.cursor_x += space_width(node.style.font_key)
     
     def input(self, node):
         w = INPUT_WIDTH_PX
@@ -254,8 +348,7 @@ class BlockLayout:
         input = InputLayout(node, line, previous_word)
         line.children.append(input)
  
-        font = get_node_font(node)
-        self.cursor_x += w + font.measureText(" ")
+        self.cursor_x += w + space_width(node.style.font_key)
 
     def new_line(self):
         self.cursor_x = 0
@@ -293,58 +386,104 @@ class LineLayout:
         for word in self.children:
             word.layout()
 
-        font_metrics = [word.font.getMetrics() for word in self.children]
-        max_ascent = max([-metric.fAscent for metric in font_metrics])
-        max_descent = max([metric.fDescent for metric in font_metrics])
+        max_ascent = max([word.font_record.ascent for word in self.children])
+        max_descent = max([word.font_record.descent for word in self.children])
         baseline = self.y + LEADING_FACTOR * max_ascent
         for word in self.children:
-            vertical_align = word.node.style.get(
-                "vertical-align", VerticalAlign.BASELINE
-            )
-            match vertical_align:
+            match word.node.style.vertical_align:
                 case VerticalAlign.BASELINE:
-                    word.y = baseline + word.font.getMetrics().fAscent
+                    word.y = baseline - word.font_record.ascent
                 case VerticalAlign.SUPER:
                     word.y = baseline - max_ascent
                 case VerticalAlign.SUB:
-                    word.y = (baseline + max_descent) - get_font_linespace(word.font)
+                    word.y = (baseline + max_descent) - word.font_record.linespace
         self.height = 1.25 * (max_ascent + max_descent)
 
 
-class TextLayout:
-    def __init__(self, node, word, parent, previous):
+class TextRunLayout:
+    """Consecutive words of a text node on one line, painted as one blob
+
+    Words are kept as offsets into the node's text, with their x positions
+    relative to the run, so a run costs a few arrays however many words
+    it has.
+    """
+
+    def __init__(self, node, parent, previous):
         self.node = node
-        self.word = word
+        self.text = node.text
+        self.starts = array("i")
+        self.ends = array("i")
+        self.offsets = array("d")
+        self.widths = array("d")
+        self.font_record = get_node_font_record(node)
+        self.font = self.font_record.font
+        self.blob = None
         self.children = []
         self.parent = parent
         self.previous = previous
         self.x = None
         self.y = None
+        self.width = 0
+
+    def add_word(self, start, end, width):
+        offset = 0
+        if self.offsets:
+            # we should think about when to add a space
+            offset = self.width + self.font_record.space_width
+        self.starts.append(start)
+        self.ends.append(end)
+        self.offsets.append(offset)
+        self.widths.append(width)
+        self.width = offset + width
+
+    def word(self, i):
+        return self.text[self.starts[i]:self.ends[i]]
+
+    def words(self):
+        """Each word with its x position"""
+        for i, offset in enumerate(self.offsets):
+            yield self.word(i), self.x + offset
+
+    def word_at(self, x):
+        """Index of the word under x, None between or outside words"""
+        i = bisect.bisect_right(self.offsets, x - self.x) - 1
+        if i < 0 or x - self.x >= self.offsets[i] + self.widths[i]:
+            return None
+        return i
+
+    def text_blob(self) -> skia.TextBlob:
+        # relative to the run's top left, so shifting keeps it
+        if self.blob is None:
+            builder = skia.TextBlobBuilder()
+            for i, offset in enumerate(self.offsets):
+                builder.allocRun(self.word(i), self.font, offset, self.font_record.ascent)
+            self.blob = builder.make()
+        return self.blob
 
     def should_paint(self):
         return True
 
     def paint(self):
-        color = self.node.style["color"]
+        color = self.node.style.color
         tags = []
         cursor_style = self.node.style.get("cursor", None)
         if cursor_style and cursor_style == "pointer":
             tags.append(POINTER_HOVER_TAG)
 
-        return [DrawText(self.word, self.font, color, x1=self.x, y1=self.y)]
+        return [DrawTextBlob(
+            self.text_blob(), self.font, color,
+            source=self.text, starts=self.starts, ends=self.ends,
+            x1=self.x, y1=self.y, width=self.width)]
 
     def layout(self):
-        self.font = get_node_font(self.node)
-        self.width = self.font.measureText(self.word)
-
-        # calculate word position
+        # calculate run position
         if self.previous:
             # we should think about when to add a space
-            space = self.previous.font.measureText(" ")
+            space = self.previous.font_record.space_width
             self.x = self.previous.x + space + self.previous.width
         else:
             self.x = self.parent.x
-        self.height = get_font_linespace(self.font)
+        self.height = self.font_record.linespace
 
 class InputLayout:
     def __init__(self, node, parent, previous):
@@ -381,19 +520,21 @@ class InputLayout:
             cx = self.x + self.font.measureText(text)
             cmds.append(DrawLine(
                  "black", 1, x1=cx, y1=self.y, x2=cx, y2=self.y + self.height ))
-        color = self.node.style["color"]
+        color = self.node.style.color
         cmds.append(DrawText(text, self.font, color, x1=self.x, y1=self.y))
         return cmds
 
     def layout(self):
-        self.font = get_node_font(self.node)
+        self.font_key = self.node.style.font_key
+        self.font_record = get_node_font_record(self.node)
+        self.font = self.font_record.font
         self.width = INPUT_WIDTH_PX
 
         # calculate word position
         if self.previous:
             # we should think about when to add a space
-            space = self.previous.font.measureText(" ")
+            space = self.previous.font_record.space_width
             self.x = self.previous.x + space + self.previous.width
         else:
             self.x = self.parent.x
-        self.height = get_font_linespace(self.font)
+        self.height = self.font_record.linespace
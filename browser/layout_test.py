@@ -0,0 +1,247 @@
+import layout
+import sys
+import unittest
+from unittest.mock import patch
+
+from css_parser import CSSParser
+from html_parser import (
+    Element,
+    HTMLParser,
+    mark_layout_dirty,
+    mark_style_dirty,
+    tree_to_list,
+)
+from layout import (
+    TEXT_WIDTH_CACHE,
+    DocumentLayout,
+    LineLayout,
+    TextRunLayout,
+    get_font,
+    measure_words,
+    space_width,
+    text_measurement_stats,
+)
+from style import CompiledStylesheet, restyle
+from tab import DEFAULT_STYLE_SHEET_CSS, paint_tree
+
+PAGE = (
+    "<div><p>first paragraph</p><p>second <b>bold</b> <input value=a></p>"
+    "<p>third</p></div><p hidden>gone</p>"
+)
+
+
+def display_list(document):
+    commands = []
+    paint_tree(document, commands)
+    return [(type(c).__name__, getattr(c, "text", ""), c.x1, c.y1) for c in commands]
+
+
+class TestIncrementalLayout(unittest.TestCase):
+    def setUp(self):
+        self.stylesheet = CompiledStylesheet(CSSParser(DEFAULT_STYLE_SHEET_CSS).parse())
+        self.tree = HTMLParser(PAGE).parse()
+        self.document = DocumentLayout(self.tree)
+        self.render()
+        self.boxes = tree_to_list(self.document, [])
+
+    def render(self):
+        restyle(self.tree, self.stylesheet)
+        self.document.layout()
+
+    def find_all(self, tag):
+        return [
+            n
+            for n in tree_to_list(self.tree, [])
+            if isinstance(n, Element) and n.tag == tag
+        ]
+
+    def box(self, node):
+        return next(b for b in tree_to_list(self.document, []) if b.node is node)
+
+    def assert_matches_fresh_layout(self):
+        for node in tree_to_list(self.tree, []):
+            self.assertFalse(node.needs_layout())
+        fresh = DocumentLayout(self.tree)
+        for node in tree_to_list(self.tree, []):
+            node.dirty_layout = True
+        fresh.layout()
+        self.assertEqual(display_list(self.document), display_list(fresh))
+
+    def test_clean_tree_keeps_every_box(self):
+        self.render()
+        self.assertEqual(
+            list(map(id, tree_to_list(self.document, []))), list(map(id, self.boxes))
+        )
+
+    def test_value_edit_keeps_boxes(self):
+        self.find_all("input")[0].set_attribute("value", "ab")
+        self.render()
+        self.assertEqual(
+            list(map(id, tree_to_list(self.document, []))), list(map(id, self.boxes))
+        )
+
+    def test_changed_block_is_rebuilt_and_later_siblings_shift(self):
+        first, second, third = self.find_all("p")[:3]
+        first_box, third_box = self.box(first), self.box(third)
+        third_lines = list(third_box.children)
+        y = third_box.y
+        second_lines = self.box(second).children
+        second.children = HTMLParser("<b>a</b><br>b<br>c").parse_fragment(second)
+        for node in second.children:
+            mark_style_dirty(node)
+        mark_layout_dirty(second)
+        self.render()
+        self.assertIs(self.box(first), first_box)
+        self.assertIsNot(self.box(second).children, second_lines)
+        self.assertIs(self.box(third), third_box)
+        self.assertEqual(third_box.children, third_lines)
+        self.assertGreater(third_box.y, y)
+        self.assertGreater(third_lines[0].children[0].y, y)
+        self.assert_matches_fresh_layout()
+
+    def test_style_change_relays_out_node(self):
+        first = self.find_all("p")[0]
+        first.set_attribute("style", "font-size: 40px")
+        self.render()
+        line = self.box(first).children[0]
+        self.assertIsInstance(line, LineLayout)
+        self.assertNotIn(line, self.boxes)
+        self.assert_matches_fresh_layout()
+
+    def test_hidden_attribute_relays_out_parent(self):
+        hidden = self.find_all("p")[3]
+        del hidden.attributes["hidden"]
+        mark_layout_dirty(hidden)
+        self.render()
+        self.assertIn("gone", [c[1] for c in display_list(self.document)])
+        hidden.set_attribute("hidden", "")
+        self.render()
+        self.assertNotIn("gone", [c[1] for c in display_list(self.document)])
+        self.assert_matches_fresh_layout()
+
+
+class TestDeepNesting(unittest.TestCase):
+    # well past the recursion limit
+    DEPTH = 3 * sys.getrecursionlimit()
+
+    def test_deep_blocks_and_inlines(self):
+        html = (
+            "<div>" * self.DEPTH
+            + "<p>"
+            + "<b>deep " * self.DEPTH
+            + "</b>" * self.DEPTH
+            + "</p>"
+            + "</div>" * self.DEPTH
+        )
+        tree = HTMLParser(html).parse()
+        self.assertGreater(len(tree_to_list(tree, [])), 3 * self.DEPTH)
+        restyle(tree, CompiledStylesheet(CSSParser(DEFAULT_STYLE_SHEET_CSS).parse()))
+        document = DocumentLayout(tree)
+        document.layout()
+        words = [c for c in display_list(document) if c[0] == "DrawTextBlob"]
+        self.assertEqual(sum(len(c[1].split()) for c in words), self.DEPTH)
+        self.assertGreater(document.height, 0)
+        # an edit deep down relays out and shifts through every level
+        paragraph = next(
+            n for n in tree_to_list(tree, []) if getattr(n, "tag", "") == "p"
+        )
+        paragraph.set_attribute("style", "font-size: 30px")
+        restyle(tree, CompiledStylesheet(CSSParser(DEFAULT_STYLE_SHEET_CSS).parse()))
+        height = document.height
+        document.layout()
+        self.assertGreater(document.height, height)
+
+
+class TestTextRuns(unittest.TestCase):
+    def layout(self, html):
+        tree = HTMLParser(html).parse()
+        restyle(tree, CompiledStylesheet(CSSParser(DEFAULT_STYLE_SHEET_CSS).parse()))
+        document = DocumentLayout(tree)
+        document.layout()
+        return [b for b in tree_to_list(document, []) if isinstance(b, TextRunLayout)]
+
+    def test_words_of_a_node_share_a_run(self):
+        runs = self.layout("<p>one two <b>bold words</b> three</p>")
+        self.assertEqual(
+            [[word for word, _ in run.words()] for run in runs],
+            [["one", "two"], ["bold", "words"], ["three"]],
+        )
+        one, two = [x for _, x in runs[0].words()]
+        self.assertEqual(two, one + runs[0].widths[0] + runs[0].font_record.space_width)
+        self.assertEqual(
+            runs[1].x, runs[0].x + runs[0].width + runs[0].font_record.space_width
+        )
+
+    def test_runs_break_with_lines(self):
+        runs = self.layout("<p>" + "word " * 200 + "</p>")
+        self.assertGreater(len(runs), 1)
+        self.assertEqual(sum(len(run.offsets) for run in runs), 200)
+        self.assertEqual(len({run.y for run in runs}), len(runs))
+
+    def test_word_at(self):
+        run = self.layout("<p>hello big world</p>")[0]
+        self.assertEqual(run.word_at(run.x), 0)
+        self.assertEqual(run.word(run.word_at(run.x + run.offsets[2] + 1)), "world")
+        # the space after hello
+        self.assertIsNone(run.word_at(run.x + run.widths[0] + 1))
+        self.assertIsNone(run.word_at(run.x + run.width))
+
+    def test_paints_one_blob_per_run(self):
+        runs = self.layout("<p>one two <i>three</i></p>")
+        commands = runs[0].paint() + runs[1].paint()
+        self.assertEqual([c.text for c in commands], ["one two", "three"])
+        self.assertEqual(commands[0].rect.width(), runs[0].width)
+        self.assertIsNotNone(commands[0].blob.bounds())
+
+
+class TestTextMeasurement(unittest.TestCase):
+    def setUp(self):
+        TEXT_WIDTH_CACHE.clear()
+
+    def test_measure_words_caches_widths(self):
+        font_key = ("Times", 12, "normal", "roman")
+        before = text_measurement_stats()
+        spans, widths = measure_words(font_key, "cached")
+        self.assertEqual(spans, [(0, 6)])
+        self.assertAlmostEqual(
+            widths[0], get_font(*font_key).measureText("cached"), places=4
+        )
+        self.assertEqual(measure_words(font_key, "cached"), (spans, widths))
+        after = text_measurement_stats()
+        self.assertEqual(after["shaped_runs"] - before["shaped_runs"], 1)
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+
+    def test_fonts_measure_separately(self):
+        _, [regular] = measure_words(("Times", 12, "normal", "roman"), "word")
+        _, [bold] = measure_words(("Times", 24, "bold", "roman"), "word")
+        self.assertNotEqual(regular, bold)
+        self.assertGreater(space_width(("Times", 24, "bold", "roman")), 0)
+
+    def test_layout_measures_text_node_once(self):
+        tree = HTMLParser("<p>" + "the same words " * 50 + "</p>").parse()
+        restyle(tree, CompiledStylesheet(CSSParser(DEFAULT_STYLE_SHEET_CSS).parse()))
+        before = text_measurement_stats()
+        DocumentLayout(tree).layout()
+        DocumentLayout(tree).layout()
+        after = text_measurement_stats()
+        self.assertEqual(after["shaped_runs"] - before["shaped_runs"], 1)
+        self.assertLessEqual(after["measurements"] - before["measurements"], 2)
+        self.assertGreater(after["hits"] - before["hits"], 140)
+
+    def test_batched_widths_match_single_words(self):
+        font_key = ("Times", 16, "bold", "italic")
+        text = " naïve\tcafé  words,\nwith 😀 glyphs "
+        for backend in [layout.numpy, None]:
+            with patch.object(layout, "numpy", backend):
+                TEXT_WIDTH_CACHE.clear()
+                spans, widths = measure_words(font_key, text)
+                words = [text[start:end] for start, end in spans]
+                self.assertEqual(words, text.split())
+                font = get_font(*font_key)
+                for word, width in zip(words, widths):
+                    self.assertAlmostEqual(width, font.measureText(word), places=4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import re
+from dataclasses import dataclass, field
+from display_constants import DEFAULT_FONT_SIZE_PX, HEIGHT, WIDTH
+
+MEDIA_TOKEN_REGEX = re.compile(r"\([^)]*\)|[^\s()]+")
+MEDIA_FEATURE_REGEX = re.compile(r"\(\s*([\w-]+)\s*(?::\s*(.*?))?\s*\)")
+LENGTH_REGEX = re.compile(r"(-?\d*\.?\d+)(px|em|rem)?")
+# media types a screen matches
+SCREEN_MEDIA_TYPES = {"all", "screen"}
+NO_PREFERENCE = "no-preference"
+DEFAULT_PREFERENCES = (
+    ("prefers-color-scheme", "light"),
+    ("prefers-contrast", NO_PREFERENCE),
+    ("prefers-reduced-motion", NO_PREFERENCE),
+    ("prefers-reduced-transparency", NO_PREFERENCE),
+)
+
+
+@dataclass(frozen=True)
+class Viewport:
+    """What media queries are evaluated against, hashable for caching"""
+
+    width: int = WIDTH
+    height: int = HEIGHT
+    preferences: tuple[tuple[str, str], ...] = DEFAULT_PREFERENCES
+
+    def preference(self, name: str) -> str:
+        return dict(self.preferences).get(name, NO_PREFERENCE)
+
+
+def parse_length(value: str) -> float | None:
+    """A px, em or rem length in pixels, None if it isn't one"""
+    match = LENGTH_REGEX.fullmatch(value)
+    if not match:
+        return None
+    number, unit = float(match.group(1)), match.group(2)
+    if unit in ("em", "rem"):
+        return number * DEFAULT_FONT_SIZE_PX
+    # unitless lengths are only valid for zero
+    if unit is None and number != 0:
+        return None
+    return number
+
+
+@dataclass(frozen=True)
+class MediaFeature:
+    name: str
+    value: str | None = None
+
+    def is_known(self) -> bool:
+        """Whether the feature can be evaluated, ranges need a length"""
+        name = self.name
+        if name.startswith("prefers-") or name == "orientation":
+            return True
+        prefix, _, dimension = name.rpartition("-")
+        if dimension not in ("width", "height") or prefix not in ("", "min", "max"):
+            return False
+        if self.value is None:
+            return not prefix
+        return parse_length(self.value) is not None
+
+    def evaluate(self, viewport: Viewport) -> bool:
+        """Whether viewport has the feature, False for unknown features"""
+        name = self.name
+        if name.startswith("prefers-"):
+            preference = viewport.preference(name)
+            if self.value is None:
+                return preference != NO_PREFERENCE
+            return preference == self.value
+        if name == "orientation":
+            orientation = (
+                "portrait" if viewport.height >= viewport.width else "landscape"
+            )
+            return self.value is None or self.value == orientation
+        prefix, _, dimension = name.rpartition("-")
+        if dimension not in ("width", "height") or prefix not in ("", "min", "max"):
+            return False
+        actual = viewport.width if dimension == "width" else viewport.height
+        if self.value is None:
+            return not prefix and actual > 0
+        length = parse_length(self.value)
+        if length is None:
+            return False
+        if prefix == "min":
+            return actual >= length
+        if prefix == "max":
+            return actual <= length
+        return actual == length
+
+
+@dataclass(frozen=True)
+class MediaQuery:
+    media_type: str = "all"
+    features: tuple[MediaFeature, ...] = ()
+    negated: bool = False
+    # queries that didn't parse never match, even negated
+    valid: bool = True
+
+    def evaluate(self, viewport: Viewport) -> bool:
+        if not self.valid:
+            return False
+        matches = self.media_type in SCREEN_MEDIA_TYPES and all(
+            feature.evaluate(viewport) for feature in self.features
+        )
+        return matches != self.negated
+
+
+@dataclass(frozen=True)
+class MediaQueryList:
+    """The condition of an @media block, true if any query is"""
+
+    queries: tuple[MediaQuery, ...] = ()
+
+    def evaluate(self, viewport: Viewport) -> bool:
+        # an empty list is "all"
+        return not self.queries or any(
+            query.evaluate(viewport) for query in self.queries
+        )
+
+
+def parse_media_query(text: str) -> MediaQuery:
+    tokens = MEDIA_TOKEN_REGEX.findall(text.casefold())
+    negated = False
+    media_type = "all"
+    features = []
+    if tokens and tokens[0] in ("not", "only"):
+        negated = tokens.pop(0) == "not"
+    if tokens and not tokens[0].startswith("("):
+        media_type = tokens.pop(0)
+        # features follow the type after an "and"
+        if tokens and (tokens.pop(0) != "and" or not tokens):
+            return MediaQuery(valid=False)
+    for i, token in enumerate(tokens):
+        match = MEDIA_FEATURE_REGEX.fullmatch(token)
+        if i % 2 == 0 and match:
+            feature = MediaFeature(*match.groups())
+            # unknown features make the query invalid, so "not" can't match it
+            if not feature.is_known():
+                return MediaQuery(valid=False)
+            features.append(feature)
+        elif i % 2 == 0 or token != "and" or i == len(tokens) - 1:
+            return MediaQuery(valid=False)
+    return MediaQuery(media_type, tuple(features), negated)
+
+
+def parse_media_query_list(text: str) -> MediaQueryList:
+    """Parses the condition between @media and its block"""
+    if not text.strip():
+        return MediaQueryList()
+    return MediaQueryList(tuple(parse_media_query(q) for q in text.split(",")))
+
+
+@dataclass
+class MediaGroup:
+    """Rules of an @media block, in effect while all conditions hold
+
+    position is the number of the sheet's other rules before the block.
+    Nested blocks add their condition to the outer ones.
+    """
+
+    conditions: tuple[MediaQueryList, ...]
+    rules: list = field(default_factory=list)
+    position: int = 0
+
+    def evaluate(self, viewport: Viewport) -> bool:
+        return all(condition.evaluate(viewport) for condition in self.conditions)
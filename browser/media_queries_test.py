@@ -0,0 +1,65 @@
+import unittest
+
+from media_queries import (
+    MediaFeature,
+    Viewport,
+    parse_media_query,
+    parse_media_query_list,
+)
+
+DESKTOP = Viewport(800, 600)
+PHONE = Viewport(360, 640, (("prefers-color-scheme", "dark"),))
+
+
+class TestMediaQueries(unittest.TestCase):
+    def test_parse(self):
+        query = parse_media_query("only Screen and (min-width: 40em) and (orientation)")
+        self.assertEqual(query.media_type, "screen")
+        self.assertEqual(
+            query.features,
+            (MediaFeature("min-width", "40em"), MediaFeature("orientation")),
+        )
+        self.assertFalse(query.negated)
+        self.assertTrue(query.valid)
+        for text in [
+            "screen (width)",
+            "(width) (height)",
+            "screen and",
+            "and (width)",
+            "(hover)",
+            "(min-width)",
+            "(max-width: wide)",
+        ]:
+            with self.subTest(text):
+                self.assertFalse(parse_media_query(text).valid)
+
+    def test_evaluate(self):
+        cases = [
+            ("", True, True),
+            ("screen", True, True),
+            ("print", False, False),
+            ("not print", True, True),
+            ("(max-width: 600px)", False, True),
+            ("(min-width: 600px) and (max-height: 600px)", True, False),
+            ("(width: 800px)", True, False),
+            ("(max-width: 30em)", False, True),
+            ("(orientation: portrait)", False, True),
+            ("(prefers-color-scheme: dark)", False, True),
+            ("(prefers-reduced-motion)", False, False),
+            ("print, (max-width: 400px)", False, True),
+            ("(unknown-feature)", False, False),
+            ("not screen and (bogus)", False, False),
+            ("not screen and (color)", False, False),
+            ("not all and (foo: 1)", False, False),
+            ("not screen (bogus)", False, False),
+            ("not (max-width: 600px)", True, False),
+        ]
+        for text, desktop, phone in cases:
+            with self.subTest(text):
+                condition = parse_media_query_list(text)
+                self.assertEqual(condition.evaluate(DESKTOP), desktop)
+                self.assertEqual(condition.evaluate(PHONE), phone)
+
+
+if __name__ == "__main__":
+    unittest.main()
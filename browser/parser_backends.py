@@ -0,0 +1,86 @@
+import html.parser
+import html_parser
+from abc import ABC, abstractmethod
+from html_parser import Node, SELF_CLOSING_TAGS
+
+DEFAULT_PARSER_BACKEND = "native"
+
+
+class ParserBackend(ABC):
+    """Turns an HTML body into an Element/Text tree
+
+    Every backend builds the same tree shape, including the implicit
+    html/head/body tags, so they can be swapped per deployment.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def parse(self, body: str) -> Node: ...
+
+
+class NativeParserBackend(ParserBackend):
+    name = "native"
+
+    def parse(self, body: str) -> Node:
+        return html_parser.HTMLParser(body).parse()
+
+
+class StdlibTokenizer(html.parser.HTMLParser):
+    """Feeds tokens from the stdlib tokenizer to our tree builder"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.builder = html_parser.HTMLParser("")
+        # data can come in several chunks, the tree wants one text run
+        self.text_run = []
+
+    def flush_text(self):
+        if self.text_run:
+            self.builder.add_text("".join(self.text_run))
+            self.text_run = []
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]):
+        self.flush_text()
+        # match get_tag_attributes: later duplicates win, bare keys are "true"
+        attributes = {key: "true" if value is None else value for key, value in attrs}
+        self.builder.add_element(tag, attributes)
+
+    def handle_startendtag(self, tag: str, attrs: list[tuple[str, str | None]]):
+        self.handle_starttag(tag, attrs)
+        if tag not in SELF_CLOSING_TAGS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag: str):
+        self.flush_text()
+        self.builder.add_element("/" + tag, {})
+
+    def handle_data(self, data: str):
+        self.text_run.append(data)
+
+    def finish(self) -> Node:
+        self.close()
+        self.flush_text()
+        return self.builder.finish()
+
+
+class StdlibParserBackend(ParserBackend):
+    name = "stdlib"
+
+    def parse(self, body: str) -> Node:
+        tokenizer = StdlibTokenizer()
+        tokenizer.feed(body)
+        return tokenizer.finish()
+
+
+PARSER_BACKENDS: dict[str, ParserBackend] = {
+    backend.name: backend for backend in [NativeParserBackend(), StdlibParserBackend()]
+}
+
+
+def get_parser_backend(name: str) -> ParserBackend:
+    if name not in PARSER_BACKENDS:
+        raise ValueError(
+            f"Unknown parser backend {name}, choose one of {list(PARSER_BACKENDS)}"
+        )
+    return PARSER_BACKENDS[name]
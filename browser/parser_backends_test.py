@@ -0,0 +1,42 @@
+import unittest
+
+from html_parser import HTMLParser
+from parser_backends import PARSER_BACKENDS, ParserBackend, get_parser_backend
+
+SAME_TREE_CASES = [
+    ("empty", ""),
+    ("text only", "hello moto"),
+    ("full tags", '<html><body><p class="text">hello moto</p></body></html>'),
+    ("missing head tag", "<html><script></script><p>hi</p></html>"),
+    ("unclosed tag", "<p>hi"),
+    ("self closing tags", "<input />hello<br>"),
+    ("bare attribute", "<input hidden value=hi>"),
+    ("character references", "AT&amp;T &copy; &#x2014; &george;"),
+    ("head content", "<title>Hi</title><link rel=stylesheet href=a.css><p>x</p>"),
+]
+
+
+class TestParserBackends(unittest.TestCase):
+    def test_backends_build_same_tree(self):
+        for title, html in SAME_TREE_CASES:
+            expected = HTMLParser(html).parse()
+            for backend in PARSER_BACKENDS.values():
+                with self.subTest(f"{backend.name}: {title}"):
+                    tree = backend.parse(html)
+                    self.assertEqual(tree, expected)
+                    self.assertEqual(tree.subtree_hash, expected.subtree_hash)
+
+    def test_backends_must_implement_parse(self):
+        class IncompleteBackend(ParserBackend):
+            name = "incomplete"
+
+        with self.assertRaises(TypeError):
+            IncompleteBackend()
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_parser_backend("lxml")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,368 @@
+import itertools
+import sys
+from bloom import CountingBloomFilter
+from css_parser import (
+    ClassSelector,
+    CSSParser,
+    DescendantSelector,
+    DirectDescendantSelector,
+    Selector,
+    TagSelector,
+    UNIVERSAL_SELECTOR,
+)
+from computed_style import INHERITED_PROPERTIES, ComputedStyle
+from html_parser import Element, Node, Text, mark_layout_dirty
+from lru import LRUCache
+from media_queries import MediaGroup, Viewport
+
+type Rule = tuple[Selector, dict[str, str]]
+# a rule with the keys its selector needs among the ancestors of a node
+type IndexedRule = tuple[Selector, dict[str, str], tuple[int, ...]]
+
+# how many recently computed styles siblings and cousins can share
+STYLE_SHARING_CACHE_SIZE = 256
+STYLE_SHARING_CACHE = LRUCache(STYLE_SHARING_CACHE_SIZE)
+# bytes each compiled stylesheet may spend remembering candidate lists
+CANDIDATES_CACHE_MAX_BYTES = 512 * 1024
+# and parsed style attributes
+INLINE_STYLES_CACHE_MAX_BYTES = 256 * 1024
+# a candidate list holds one of these per rule, the rule is the sheet's
+INDEXED_RULE_BYTES = sys.getsizeof((None, None, None))
+# stands for a sharing key within a style pass, children's keys use it
+SHARING_TOKENS = itertools.count()
+
+
+def cascade_priority(rule):
+    selector, body = rule
+    return selector.priority
+
+
+def rule_key(selector: Selector) -> tuple[str, str] | None:
+    """Key of the rightmost simple selector, None for the universal one
+
+    A node can only match a rule if it matches that rightmost part.
+    """
+    while isinstance(selector, (DescendantSelector, DirectDescendantSelector)):
+        selector = selector.descendant
+    if isinstance(selector, ClassSelector):
+        return ("class", selector.class_selector)
+    if selector.tag == UNIVERSAL_SELECTOR:
+        return None
+    return ("tag", selector.tag)
+
+
+def simple_selector_keys(selector: Selector) -> set[int]:
+    """Hashed keys of every simple selector in selector, bar universal ones"""
+    if isinstance(selector, (DescendantSelector, DirectDescendantSelector)):
+        return simple_selector_keys(selector.ancestor) | simple_selector_keys(
+            selector.descendant
+        )
+    key = rule_key(selector)
+    return set() if key is None else {hash(key)}
+
+
+def ancestor_keys(selector: Selector) -> tuple[int, ...]:
+    """Keys that must all be among a node's ancestors for selector to match"""
+    keys = set()
+    while isinstance(selector, (DescendantSelector, DirectDescendantSelector)):
+        keys |= simple_selector_keys(selector.ancestor)
+        selector = selector.descendant
+    return tuple(keys)
+
+
+def element_keys(node: Node) -> list[int]:
+    """Keys node adds to the ancestor filter of its descendants"""
+    if not isinstance(node, Element):
+        return []
+    keys = [hash(("tag", node.tag))]
+    for class_name in node.classes():
+        keys.append(hash(("class", class_name)))
+    return keys
+
+
+def style_sharing_stats() -> dict[str, int]:
+    """Hits and misses of style sharing since the last reset"""
+    return STYLE_SHARING_CACHE.stats()
+
+
+def reset_style_sharing_stats():
+    STYLE_SHARING_CACHE.reset_stats()
+
+
+def ancestor_filter(node: Node) -> CountingBloomFilter:
+    ancestors = CountingBloomFilter()
+    parent = node.parent
+    while parent:
+        for key in element_keys(parent):
+            ancestors.add(key)
+        parent = parent.parent
+    return ancestors
+
+
+class CompiledStylesheet:
+    """A page's rules, prepared once when its stylesheets load
+
+    Rules are bucketed by the tag or class their rightmost selector needs,
+    so nodes only test the rules in their tag and class buckets plus the
+    universal ones, still in cascade order. Inline style attributes are
+    parsed once per distinct value, while the value stays cached.
+
+    Rules of @media groups are only in the buckets while their group is
+    active for the viewport, see set_viewport.
+    """
+
+    def __init__(
+        self,
+        rules: list[Rule],
+        media_groups: list[MediaGroup] = (),
+        viewport: Viewport = Viewport(),
+    ):
+        # groups join the rules where their block was in the source
+        source_rules = []
+        source_groups = []
+        groups = sorted(enumerate(media_groups), key=lambda g: g[1].position)
+        for position in range(len(rules) + 1):
+            while groups and groups[0][1].position <= position:
+                group, media_group = groups.pop(0)
+                source_rules.extend(media_group.rules)
+                source_groups.extend([group] * len(media_group.rules))
+            if position < len(rules):
+                source_rules.append(rules[position])
+                source_groups.append(None)
+        # cascade order is the sort order with ties kept in source order
+        order = sorted(
+            range(len(source_rules)), key=lambda i: cascade_priority(source_rules[i])
+        )
+        self.rules = [source_rules[i] for i in order]
+        self.ancestor_keys = [ancestor_keys(selector) for selector, _ in self.rules]
+        self.media_groups = list(media_groups)
+        self.group_rules: list[list[int]] = [[] for _ in self.media_groups]
+        self.tag_rules: dict[str, list[int]] = {}
+        self.class_rules: dict[str, list[int]] = {}
+        self.universal_rules: list[int] = []
+        for i, source in enumerate(order):
+            if source_groups[source] is None:
+                self.bucket(i).append(i)
+            else:
+                self.group_rules[source_groups[source]].append(i)
+        # elements with the same tag and class attribute share candidates;
+        # bounded, the stylesheet is shared by every page that uses its sheets
+        self.candidates_cache = LRUCache(CANDIDATES_CACHE_MAX_BYTES)
+        self.inline_styles = LRUCache(INLINE_STYLES_CACHE_MAX_BYTES)
+        # which groups apply, per viewport seen
+        self.media_results: dict[Viewport, tuple[bool, ...]] = {}
+        self.active_groups = tuple(False for _ in self.media_groups)
+        self.set_viewport(viewport)
+
+    def index_bytes(self) -> int:
+        """Bytes of the indexes, the rules belong to the parsed sheets"""
+        lists = [
+            self.rules,
+            self.ancestor_keys,
+            *self.ancestor_keys,
+            self.universal_rules,
+            *self.group_rules,
+            *self.tag_rules.values(),
+            *self.class_rules.values(),
+        ]
+        dicts = [self.tag_rules, self.class_rules]
+        return sum(map(sys.getsizeof, lists)) + sum(map(sys.getsizeof, dicts))
+
+    def max_bytes(self) -> int:
+        """Most bytes the stylesheet can hold, with full memo caches"""
+        memos = self.candidates_cache.max_size + self.inline_styles.max_size
+        return self.index_bytes() + memos
+
+    def bucket(self, i: int) -> list[int]:
+        key = rule_key(self.rules[i][0])
+        if key is None:
+            return self.universal_rules
+        elif key[0] == "tag":
+            return self.tag_rules.setdefault(key[1], [])
+        else:
+            return self.class_rules.setdefault(key[1], [])
+
+    def set_viewport(self, viewport: Viewport) -> bool:
+        """Activates the media groups viewport matches, True if any changed
+
+        Groups whose result didn't change are left alone, as are cached
+        candidates that don't involve the changed groups' rules.
+        """
+        if viewport not in self.media_results:
+            self.media_results[viewport] = tuple(
+                group.evaluate(viewport) for group in self.media_groups
+            )
+        active = self.media_results[viewport]
+        changed = [
+            group
+            for group, (was, now) in enumerate(zip(self.active_groups, active))
+            if was != now
+        ]
+        self.active_groups = active
+        for group in changed:
+            for i in self.group_rules[group]:
+                bucket = self.bucket(i)
+                if active[group]:
+                    bucket.append(i)
+                else:
+                    bucket.remove(i)
+            self.forget_candidates(self.group_rules[group])
+        return bool(changed)
+
+    def forget_candidates(self, indices: list[int]):
+        """Drops the cached candidates that rules at indices may be in"""
+        keys = [rule_key(self.rules[i][0]) for i in indices]
+        if None in keys:
+            self.candidates_cache.clear()
+            return
+        tags = {name for kind, name in keys if kind == "tag"}
+        classes = {name for kind, name in keys if kind == "class"}
+        for key in list(self.candidates_cache.entries):
+            tag, class_attribute = key
+            if tag in tags or not classes.isdisjoint(class_attribute.split()):
+                self.candidates_cache.pop(key)
+
+    def candidates(self, node: Node) -> list[IndexedRule]:
+        """Rules that might match node, in cascade order"""
+        if not isinstance(node, Element):
+            return []
+        key = (node.tag, node.attributes.get("class", ""))
+        rules = self.candidates_cache.get(key)
+        if rules is None:
+            indices = self.universal_rules + self.tag_rules.get(node.tag, [])
+            for class_name in node.classes():
+                indices = indices + self.class_rules.get(class_name, [])
+            rules = [(*self.rules[i], self.ancestor_keys[i]) for i in sorted(indices)]
+            self.candidates_cache.put(key, rules, candidates_bytes(key, rules))
+        return rules
+
+    def inline_style(self, value: str) -> dict[str, str]:
+        """Declarations of a style attribute, callers must not change them"""
+        body = self.inline_styles.get(value)
+        if body is None:
+            body = CSSParser(value).body()
+            self.inline_styles.put(value, body, inline_style_bytes(value, body))
+        return body
+
+
+def candidates_bytes(key: tuple[str, str], rules: list[IndexedRule]) -> int:
+    return (
+        sys.getsizeof(key[1]) + sys.getsizeof(rules) + len(rules) * INDEXED_RULE_BYTES
+    )
+
+
+def inline_style_bytes(value: str, body: dict[str, str]) -> int:
+    strings = itertools.chain([value], body.keys(), body.values())
+    return sys.getsizeof(body) + sum(map(sys.getsizeof, strings))
+
+
+def sharing_key(
+    node: Node, parent_token: int | None
+) -> tuple[int, str | None, str | None] | None:
+    """Nodes with equal keys compute equal styles, None if node can't share
+
+    Selectors only look at tags and classes. parent_token is the same for
+    parents with the same key, so equal keys mean equal tags and classes all
+    the way up.
+    """
+    if parent_token is None:
+        return None
+    if isinstance(node, Text):
+        return (parent_token, None, None)
+    if "style" in node.attributes:
+        return None
+    return (parent_token, node.tag, node.attributes.get("class", ""))
+
+
+def compute_style(
+    node: Node, rules: CompiledStylesheet, ancestors: CountingBloomFilter
+) -> ComputedStyle:
+    values = {}
+    # apply rules from CSS stylesheets
+    for selector, body, keys in rules.candidates(node):
+        if not ancestors.might_contain_all(keys) or not selector.matcher(node):
+            continue
+        values.update(body)
+    # apply rules from 'style' attribute
+    if isinstance(node, Element) and "style" in node.attributes:
+        values.update(rules.inline_style(node.attributes["style"]))
+    # compute actual values for percentages
+    parent_style = node.parent.style if node.parent else None
+    if parent_style:
+        parent_font_size = parent_style["font-size"]
+    else:
+        parent_font_size = INHERITED_PROPERTIES["font-size"]
+    node_font_size = values.get("font-size", "")
+    if node_font_size.endswith("%"):
+        node_pct = float(node_font_size[:-1]) / 100
+        parent_px = float(parent_font_size[:-2])
+        values["font-size"] = str(node_pct * parent_px) + "px"
+    elif node_font_size == "inherit":
+        values["font-size"] = parent_font_size
+    # everything else is inherited or default values
+    return ComputedStyle.from_values(parent_style, values)
+
+
+def restyle(
+    node: Node,
+    rules: CompiledStylesheet,
+    ancestors: CountingBloomFilter | None = None,
+    parent_token: int | None = None,
+    force: bool = False,
+):
+    """Recomputes the styles of the dirty nodes in node's subtree
+
+    Clean subtrees are skipped unless force is set. ancestors holds the tags
+    and classes above node, rules whose ancestor keys are missing from it are
+    rejected without walking the parents. Nodes reuse the style of a
+    recently styled node with the same sharing key, parent_token stands for
+    the parent's key.
+    """
+    if ancestors is None:
+        ancestors = ancestor_filter(node)
+        STYLE_SHARING_CACHE.clear()
+    # nodes to style with their parent's token and force, in document order,
+    # and (None, keys, False) markers for leaving an element's subtree
+    stack: list[tuple] = [(node, parent_token, force)]
+    while stack:
+        entry = stack.pop()
+        if entry[0] is None:
+            _, keys, _ = entry
+            for key in keys:
+                ancestors.remove(key)
+            continue
+        node, parent_token, force = entry
+        force_children = force or node.dirty_inherited
+        if force_children or node.dirty_style:
+            old_style = node.style
+            key = sharing_key(node, parent_token)
+            shared = STYLE_SHARING_CACHE.get(key) if key else None
+            if shared is not None:
+                node.style, token = shared
+            else:
+                node.style = compute_style(node, rules, ancestors)
+                token = next(SHARING_TOKENS)
+                if key:
+                    STYLE_SHARING_CACHE.put(key, (node.style, token), 1)
+            if node.style is not old_style:
+                mark_layout_dirty(node)
+                # children inherit from the new style
+                force_children = True
+        else:
+            token = next(SHARING_TOKENS)
+        visit_children = force_children or node.dirty_children
+        node.dirty_style = node.dirty_children = node.dirty_inherited = False
+        if not visit_children:
+            continue
+
+        keys = element_keys(node)
+        for key in keys:
+            ancestors.add(key)
+        stack.append((None, keys, False))
+        for child in reversed(node.children):
+            stack.append((child, token, force_children))
+
+
+def style(node: Node, rules: CompiledStylesheet):
+    """Computes the style of node and its whole subtree"""
+    restyle(node, rules, force=True)
@@ -0,0 +1,182 @@
+import json
+import time
+from css_parser import (
+    ClassSelector,
+    DescendantSelector,
+    DirectDescendantSelector,
+    Matcher,
+    Selector,
+    descendant_matcher,
+    direct_descendant_matcher,
+)
+from dataclasses import asdict, dataclass
+from html_parser import Node
+from style import CompiledStylesheet, IndexedRule, restyle
+
+PROFILE_FORMATS = ["text", "json"]
+# rules shown in a report, the most expensive first
+DEFAULT_REPORT_RULES = 10
+
+
+def selector_text(selector: Selector) -> str:
+    if isinstance(selector, DescendantSelector):
+        return (
+            f"{selector_text(selector.ancestor)} {selector_text(selector.descendant)}"
+        )
+    if isinstance(selector, DirectDescendantSelector):
+        return (
+            f"{selector_text(selector.ancestor)} > {selector_text(selector.descendant)}"
+        )
+    if isinstance(selector, ClassSelector):
+        return f".{selector.class_selector}"
+    return selector.tag
+
+
+@dataclass
+class RuleStats:
+    selector: str
+    declarations: int
+    attempts: int = 0
+    matches: int = 0
+    ancestor_steps: int = 0
+    seconds: float = 0.0
+
+
+def counting_matcher(selector: Selector, stats: RuleStats) -> Matcher:
+    """selector's matcher, counting each ancestor it tests in stats"""
+    if not isinstance(selector, (DescendantSelector, DirectDescendantSelector)):
+        return selector.matcher
+    ancestor = counting_matcher(selector.ancestor, stats)
+
+    def counted_ancestor(node: Node) -> bool:
+        stats.ancestor_steps += 1
+        return ancestor(node)
+
+    descendant = counting_matcher(selector.descendant, stats)
+    if isinstance(selector, DescendantSelector):
+        return descendant_matcher(counted_ancestor, descendant)
+    return direct_descendant_matcher(counted_ancestor, descendant)
+
+
+class ProfiledSelector:
+    """Stands in for a selector in style(), timing and counting its matches"""
+
+    def __init__(self, selector: Selector, stats: RuleStats):
+        matcher = counting_matcher(selector, stats)
+        clock = time.perf_counter
+
+        def matches(node: Node) -> bool:
+            start = clock()
+            matched = matcher(node)
+            stats.seconds += clock() - start
+            stats.attempts += 1
+            stats.matches += matched
+            return matched
+
+        self.selector = selector
+        self.matcher = matches
+
+
+class ProfiledStylesheet:
+    """A CompiledStylesheet whose candidate rules report to a profiler"""
+
+    def __init__(self, stylesheet: CompiledStylesheet, profiler: "StyleProfiler"):
+        self.stylesheet = stylesheet
+        self.profiler = profiler
+        # entries hold their source list, a forgotten list's id can't be reused
+        self.candidates_cache: dict[
+            int, tuple[list[IndexedRule], list[IndexedRule]]
+        ] = {}
+
+    def candidates(self, node: Node) -> list[IndexedRule]:
+        self.profiler.nodes += 1
+        rules = self.stylesheet.candidates(node)
+        # the stylesheet caches its lists, so one profiled list per list
+        cached = self.candidates_cache.get(id(rules))
+        if cached is None or cached[0] is not rules:
+            cached = (
+                rules,
+                [
+                    (self.profiler.profiled_selector(selector, body), body, keys)
+                    for selector, body, keys in rules
+                ],
+            )
+            self.candidates_cache[id(rules)] = cached
+        return cached[1]
+
+    def inline_style(self, value: str) -> dict[str, str]:
+        return self.stylesheet.inline_style(value)
+
+
+class StyleProfiler:
+    """Opt-in per rule costs of style passes, reset on each page load
+
+    Each rule's stats count the times its selector was tested against a
+    node (after the ancestor filter), the successful matches, the ancestors
+    descendant selectors walked, and the time spent matching.
+    """
+
+    def __init__(self, report_format: str = "text"):
+        self.report_format = report_format
+        self.reset()
+
+    def reset(self):
+        self.rules: dict[tuple[int, int], RuleStats] = {}
+        self.selectors: dict[tuple[int, int], ProfiledSelector] = {}
+        # profiled lists hold on to rules, so they go with the stats
+        self.stylesheets: dict[int, ProfiledStylesheet] = {}
+        self.passes = 0
+        self.nodes = 0
+        self.seconds = 0.0
+
+    def profiled_selector(
+        self, selector: Selector, body: dict[str, str]
+    ) -> ProfiledSelector:
+        # rules share selector objects and bodies, but never both
+        key = (id(selector), id(body))
+        if key not in self.selectors:
+            stats = RuleStats(selector_text(selector), len(body))
+            self.rules[key] = stats
+            self.selectors[key] = ProfiledSelector(selector, stats)
+        return self.selectors[key]
+
+    def restyle(self, node: Node, stylesheet: CompiledStylesheet):
+        """style.restyle, with stylesheet's rules profiled"""
+        if id(stylesheet) not in self.stylesheets:
+            self.stylesheets[id(stylesheet)] = ProfiledStylesheet(stylesheet, self)
+        profiled = self.stylesheets[id(stylesheet)]
+        start = time.perf_counter()
+        restyle(node, profiled)
+        self.seconds += time.perf_counter() - start
+        self.passes += 1
+
+    def top_rules(self, count: int = DEFAULT_REPORT_RULES) -> list[RuleStats]:
+        return sorted(self.rules.values(), key=lambda stats: -stats.seconds)[:count]
+
+    def report_json(self, count: int = DEFAULT_REPORT_RULES) -> str:
+        return json.dumps(
+            {
+                "passes": self.passes,
+                "nodes": self.nodes,
+                "seconds": self.seconds,
+                "rules": [asdict(stats) for stats in self.top_rules(count)],
+            }
+        )
+
+    def report_text(self, count: int = DEFAULT_REPORT_RULES) -> str:
+        lines = [
+            f"style passes: {self.passes}, nodes computed: {self.nodes},"
+            f" time: {self.seconds * 1000:.1f}ms",
+            f"{'selector':<40} {'attempts':>9} {'matches':>9} {'ancestors':>10} {'ms':>8}",
+        ]
+        for stats in self.top_rules(count):
+            lines.append(
+                f"{stats.selector[-40:]:<40} {stats.attempts:>9} {stats.matches:>9}"
+                f" {stats.ancestor_steps:>10} {stats.seconds * 1000:>8.2f}"
+            )
+        return "\n".join(lines)
+
+    def report(self, count: int = DEFAULT_REPORT_RULES) -> str:
+        if self.report_format == "json":
+            return self.report_json(count)
+        return self.report_text(count)
@@ -0,0 +1,77 @@
+import json
+import unittest
+
+from css_parser import CSSParser
+from html_parser import HTMLParser, mark_style_dirty, tree_to_list
+from media_queries import Viewport
+from style import CompiledStylesheet, style
+from style_profiler import StyleProfiler, selector_text
+
+STYLESHEET = """
+p { color: red; }
+div .note { font-weight: bold; }
+ul > li { font-style: italic; }
+"""
+
+
+class TestStyleProfiler(unittest.TestCase):
+    def setUp(self):
+        self.tree = HTMLParser(
+            "<div><section><p class=note>a</p></section></div><ul><li>b</li></ul>"
+        ).parse()
+        self.stylesheet = CompiledStylesheet(CSSParser(STYLESHEET).parse())
+        self.profiler = StyleProfiler()
+        self.profiler.restyle(self.tree, self.stylesheet)
+
+    def stats(self, selector):
+        return next(s for s in self.profiler.rules.values() if s.selector == selector)
+
+    def test_counts_attempts_matches_and_ancestors(self):
+        self.assertEqual(self.profiler.passes, 1)
+        p = self.stats("p")
+        self.assertEqual((p.attempts, p.matches, p.ancestor_steps), (1, 1, 0))
+        note = self.stats("div .note")
+        # section is tested before div
+        self.assertEqual((note.attempts, note.matches, note.ancestor_steps), (1, 1, 2))
+        li = self.stats("ul > li")
+        self.assertEqual((li.attempts, li.matches, li.ancestor_steps), (1, 1, 1))
+
+    def test_styles_match_unprofiled_style(self):
+        profiled = [node.style for node in tree_to_list(self.tree, [])]
+        style(self.tree, self.stylesheet)
+        self.assertEqual(profiled, [node.style for node in tree_to_list(self.tree, [])])
+
+    def test_styles_follow_media_changes(self):
+        parser = CSSParser(
+            "p { color: red; } @media (max-width: 500px) { p { color: blue; } }"
+        )
+        stylesheet = CompiledStylesheet(parser.parse(), parser.media_groups)
+        paragraph = next(
+            n for n in tree_to_list(self.tree, []) if getattr(n, "tag", "") == "p"
+        )
+        # toggling the group drops the stylesheet's candidate lists each time
+        for width in [400, 800, 400, 800]:
+            stylesheet.set_viewport(Viewport(width, 600))
+            mark_style_dirty(self.tree, subtree=True)
+            self.profiler.restyle(self.tree, stylesheet)
+            profiled = paragraph.style["color"]
+            style(self.tree, stylesheet)
+            self.assertEqual(profiled, paragraph.style["color"])
+            self.assertEqual(profiled, "blue" if width < 500 else "red")
+
+    def test_reports(self):
+        report = json.loads(self.profiler.report_json(count=2))
+        self.assertEqual(report["passes"], 1)
+        self.assertEqual(len(report["rules"]), 2)
+        self.assertIn("ancestor_steps", report["rules"][0])
+        self.assertIn("div .note", self.profiler.report_text())
+        self.profiler.reset()
+        self.assertEqual(self.profiler.rules, {})
+
+    def test_selector_text(self):
+        selectors = [s for s, _ in CSSParser("a > .b c, d { x: y }").parse()]
+        self.assertEqual([selector_text(s) for s in selectors], ["a > .b c", "d"])
+
+
+if __name__ == "__main__":
+    unittest.main()
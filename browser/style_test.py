@@ -0,0 +1,356 @@
+import unittest
+from unittest.mock import patch
+
+from bloom import CountingBloomFilter
+from computed_style import DEFAULT_INHERITED, INHERITED_PROPERTIES, ComputedStyle
+from css_values import BLACK, DisplayValue, VerticalAlign
+from css_parser import CSSParser
+from html_parser import HTMLParser, mark_style_dirty, tree_to_list
+from media_queries import Viewport
+from style import (
+    CompiledStylesheet,
+    reset_style_sharing_stats,
+    restyle,
+    rule_key,
+    style,
+    style_sharing_stats,
+)
+
+STYLESHEET = """
+p { color: red; }
+.note { background-color: blue; }
+div .note { font-weight: bold; }
+* { cursor: pointer; }
+div > span { font-style: italic; }
+"""
+
+
+def find(tree, tag):
+    return next(n for n in tree_to_list(tree, []) if getattr(n, "tag", None) == tag)
+
+
+class TestCompiledStylesheet(unittest.TestCase):
+    def test_rule_key(self):
+        keys = [rule_key(selector) for selector, _ in CSSParser(STYLESHEET).parse()]
+        self.assertEqual(
+            keys,
+            [("tag", "p"), ("class", "note"), ("class", "note"), None, ("tag", "span")],
+        )
+
+    def test_candidates_keep_cascade_order(self):
+        index = CompiledStylesheet(CSSParser(STYLESHEET).parse())
+        tree = HTMLParser('<div><p class="note extra note">x</p></div>').parse()
+        candidates = index.candidates(find(tree, "p"))
+        rules = [(selector, body) for selector, body, _ in candidates]
+        self.assertEqual(rules, [r for r in index.rules if r in rules])
+        self.assertEqual(len(candidates), 4)
+
+    def test_ties_keep_source_order(self):
+        stylesheet = CompiledStylesheet(
+            CSSParser(
+                "p { color: red; } .x { color: blue; } p { color: green; }"
+            ).parse()
+        )
+        self.assertEqual(
+            [body["color"] for _, body in stylesheet.rules], ["blue", "red", "green"]
+        )
+
+    def test_inline_styles_are_parsed_once(self):
+        stylesheet = CompiledStylesheet([])
+        tree = HTMLParser(
+            "<p style='color: red'>a</p><p style='color: red'>b</p>"
+        ).parse()
+        style(tree, stylesheet)
+        a, b = [n for n in tree_to_list(tree, []) if getattr(n, "tag", "") == "p"]
+        self.assertEqual(a.style["color"], "red")
+        self.assertEqual(list(stylesheet.inline_styles.entries), ["color: red"])
+        self.assertEqual(stylesheet.inline_styles.stats()["hits"], 1)
+
+    def test_inline_styles_cache_is_bounded(self):
+        with patch("style.INLINE_STYLES_CACHE_MAX_BYTES", 4096):
+            stylesheet = CompiledStylesheet([])
+        for i in range(100):
+            stylesheet.inline_style(f"width: {i}px")
+        self.assertLessEqual(stylesheet.inline_styles.size, 4096)
+        self.assertGreater(stylesheet.inline_styles.evictions, 0)
+
+    def test_candidates_cache_is_bounded(self):
+        with patch("style.CANDIDATES_CACHE_MAX_BYTES", 1024):
+            index = CompiledStylesheet(CSSParser(STYLESHEET).parse())
+        for i in range(100):
+            tree = HTMLParser(f'<p class="note c{i}">x</p>').parse()
+            index.candidates(find(tree, "p"))
+        self.assertLessEqual(index.candidates_cache.size, 1024)
+        self.assertGreater(index.candidates_cache.evictions, 0)
+
+    def test_text_has_no_candidates(self):
+        index = CompiledStylesheet(CSSParser(STYLESHEET).parse())
+        tree = HTMLParser("<p>x</p>").parse()
+        self.assertEqual(index.candidates(find(tree, "p").children[0]), [])
+
+    def test_style_applies_matching_rules(self):
+        tree = HTMLParser('<div><p class="note">x</p><span>y</span></div>').parse()
+        style(tree, CompiledStylesheet(CSSParser(STYLESHEET).parse()))
+        p = find(tree, "p")
+        self.assertEqual(p.style["background-color"], "blue")
+        self.assertEqual(p.style["font-weight"], "bold")
+        self.assertEqual(p.style["cursor"], "pointer")
+        self.assertEqual(find(tree, "span").style["font-style"], "italic")
+
+    def test_ancestor_keys_skip_missing_ancestors(self):
+        tree = HTMLParser('<div class="a"><p class="note">x</p></div><p>y</p>').parse()
+        index = CompiledStylesheet(CSSParser(STYLESHEET).parse())
+        keys = [k for _, _, k in index.candidates(find(tree, "p"))]
+        self.assertEqual(sorted(map(len, keys)), [0, 0, 0, 1])
+        style(tree, index)
+        p, other_p = [n for n in tree_to_list(tree, []) if getattr(n, "tag", "") == "p"]
+        self.assertEqual(p.style["font-weight"], "bold")
+        self.assertEqual(other_p.style["font-weight"], "normal")
+
+    def test_style_subtree_seeds_filter_from_parents(self):
+        tree = HTMLParser('<div><p class="note">x</p></div>').parse()
+        index = CompiledStylesheet(CSSParser(STYLESHEET).parse())
+        style(tree, index)
+        p = find(tree, "p")
+        p.style = {}
+        style(p, index)
+        self.assertEqual(p.style["font-weight"], "bold")
+
+
+class TestMediaGroups(unittest.TestCase):
+    CSS = """
+    p { color: red; }
+    @media (max-width: 500px) { p { color: green; } .wide { display: none; } }
+    p { font-style: italic; }
+    @media (min-width: 501px) { * { font-weight: bold; } }
+    """
+
+    def setUp(self):
+        parser = CSSParser(self.CSS)
+        rules = parser.parse()
+        self.stylesheet = CompiledStylesheet(rules, parser.media_groups)
+        self.tree = HTMLParser("<p class=wide>x</p><div>y</div>").parse()
+        self.p = find(self.tree, "p")
+
+    def test_only_active_groups_are_candidates(self):
+        self.assertEqual(self.stylesheet.active_groups, (False, True))
+        bodies = [body for _, body, _ in self.stylesheet.candidates(self.p)]
+        self.assertNotIn({"color": "green"}, bodies)
+        style(self.tree, self.stylesheet)
+        self.assertEqual(self.p.style["color"], "red")
+        self.assertEqual(self.p.style["font-weight"], "bold")
+
+    def test_viewport_change_toggles_groups_in_source_order(self):
+        self.stylesheet.candidates(find(self.tree, "div"))
+        self.assertTrue(self.stylesheet.set_viewport(Viewport(400, 600)))
+        self.assertEqual(self.stylesheet.active_groups, (True, False))
+        style(self.tree, self.stylesheet)
+        # the media rule comes after the first p rule in the cascade
+        self.assertEqual(self.p.style["color"], "green")
+        self.assertEqual(self.p.style["font-style"], "italic")
+        self.assertEqual(self.p.style["font-weight"], "normal")
+        self.assertFalse(self.stylesheet.set_viewport(Viewport(300, 600)))
+        self.assertEqual(len(self.stylesheet.media_results), 3)
+
+    def test_unchanged_groups_keep_cached_candidates(self):
+        stylesheet = CompiledStylesheet(
+            *self.parse("p { color: red; } @media (max-width: 500px) { .x { a: b } }")
+        )
+        candidates = stylesheet.candidates(self.p)
+        stylesheet.set_viewport(Viewport(400, 600))
+        # the .x rule can't be among a .wide paragraph's candidates
+        self.assertIs(stylesheet.candidates(self.p), candidates)
+
+    def parse(self, css):
+        parser = CSSParser(css)
+        return parser.parse(), parser.media_groups
+
+
+class TestCountingBloomFilter(unittest.TestCase):
+    def test_add_and_remove(self):
+        bloom = CountingBloomFilter()
+        keys = [hash(("tag", "div")), hash(("class", "note"))]
+        for key in keys:
+            bloom.add(key)
+        bloom.add(keys[0])
+        self.assertTrue(bloom.might_contain_all(tuple(keys)))
+        bloom.remove(keys[0])
+        self.assertTrue(bloom.might_contain(keys[0]))
+        bloom.remove(keys[0])
+        bloom.remove(keys[1])
+        self.assertFalse(bloom.might_contain(keys[0]))
+        self.assertTrue(bloom.might_contain_all(()))
+
+
+class TestStyleSharing(unittest.TestCase):
+    def test_siblings_share_styles(self):
+        tree = HTMLParser(
+            "<ul><li>a</li><li>b</li><li class=x>c</li><li style='color:red'>d</li></ul>"
+        ).parse()
+        style(tree, CompiledStylesheet(CSSParser(STYLESHEET).parse()))
+        a, b, c, d = [
+            n for n in tree_to_list(tree, []) if getattr(n, "tag", "") == "li"
+        ]
+        self.assertIs(a.style, b.style)
+        self.assertIs(a.children[0].style, b.children[0].style)
+        # no rule matches x, so the interned style is the same too
+        self.assertIs(a.style, c.style)
+        self.assertEqual(d.style["color"], "red")
+        self.assertIsNot(d.style, a.style)
+
+    def test_cousins_share_styles(self):
+        tree = HTMLParser("<div><p>a</p></div><div><p>b</p></div>").parse()
+        style(tree, CompiledStylesheet(CSSParser(STYLESHEET).parse()))
+        a, b = [n for n in tree_to_list(tree, []) if getattr(n, "tag", "") == "p"]
+        self.assertIs(a.style, b.style)
+
+    def test_counts_share_hits(self):
+        reset_style_sharing_stats()
+        tree = HTMLParser("<p>a</p><p>b</p><p>c</p>").parse()
+        style(tree, CompiledStylesheet([]))
+        # two paragraphs and their text reuse the first ones
+        self.assertEqual(style_sharing_stats()["hits"], 4)
+        reset_style_sharing_stats()
+        self.assertEqual(style_sharing_stats()["hits"], 0)
+        self.assertEqual(style_sharing_stats()["misses"], 0)
+
+
+class TestComputedStyle(unittest.TestCase):
+    def test_equal_styles_are_interned(self):
+        tree = HTMLParser(
+            "<div><p class=a>a</p></div><section><p class=b>b</p></section>"
+        ).parse()
+        style(tree, CompiledStylesheet(CSSParser(STYLESHEET).parse()))
+        a, b = [n for n in tree_to_list(tree, []) if getattr(n, "tag", "") == "p"]
+        # different sharing keys but the same computed values
+        self.assertIs(a.style, b.style)
+        self.assertEqual(
+            ComputedStyle.from_values(None, {"color": "red"}),
+            ComputedStyle.from_values(None, {"color": "red"}),
+        )
+
+    def test_inherited_values_are_shared_with_parent(self):
+        parent = ComputedStyle.from_values(None, {"display": "block"})
+        child = ComputedStyle.from_values(parent, {"color": "black"})
+        self.assertIs(child.inherited, parent.inherited)
+        self.assertNotIn("display", child)
+        self.assertEqual(child.get("display", "inline"), "inline")
+        changed = ComputedStyle.from_values(parent, {"font-size": "20px"})
+        self.assertEqual(changed["font-size"], "20px")
+        self.assertEqual(changed["font-family"], "Times")
+
+    def test_reads_like_a_dict(self):
+        computed = ComputedStyle.from_values(None, {"display": "block"})
+        self.assertEqual(dict(computed), {**INHERITED_PROPERTIES, "display": "block"})
+        self.assertEqual(computed, {**INHERITED_PROPERTIES, "display": "block"})
+        with self.assertRaises(TypeError):
+            computed["color"] = "red"
+        with self.assertRaises(AttributeError):
+            computed.own = {}
+
+    def test_typed_values_are_resolved(self):
+        computed = ComputedStyle.from_values(
+            None,
+            {
+                "display": "block",
+                "font-size": "20px",
+                "font-style": "normal",
+                "font-family": "'Courier', monospace",
+                "background": "url(a.png) red, #00f",
+                "width": "100px",
+                "vertical-align": "sub",
+            },
+        )
+        self.assertEqual(computed.font_key, ("Courier", 15, "normal", "roman"))
+        self.assertIs(computed.display, DisplayValue.BLOCK)
+        self.assertIs(computed.vertical_align, VerticalAlign.SUB)
+        self.assertEqual(computed.color, BLACK)
+        self.assertEqual(computed.background_color, 0xFF0000FF)
+        self.assertEqual((computed.width, computed.height), (100, None))
+
+    def test_unknown_values_have_typed_defaults(self):
+        computed = ComputedStyle.from_values(
+            None, {"display": "none", "vertical-align": "top", "color": "nope"}
+        )
+        self.assertIsNone(computed.display)
+        self.assertIs(computed.vertical_align, VerticalAlign.BASELINE)
+        self.assertEqual(computed.color, BLACK)
+        self.assertIsNone(computed.background_color)
+        self.assertEqual(computed.border_radius, 0.0)
+
+    def test_own_values_are_a_read_only_copy(self):
+        own = {"width": "5px"}
+        computed = ComputedStyle(DEFAULT_INHERITED, own)
+        own["width"] = "6px"
+        self.assertEqual(computed["width"], "5px")
+        self.assertIs(ComputedStyle(DEFAULT_INHERITED, {"width": "5px"}), computed)
+        with self.assertRaises(TypeError):
+            computed.own["width"] = "6px"
+
+    def test_with_values_keeps_other_values(self):
+        parent = ComputedStyle.from_values(None, {"color": "red", "width": "5px"})
+        block = parent.with_values({"display": "block"})
+        self.assertIs(block.display, DisplayValue.BLOCK)
+        self.assertEqual((block["color"], block.width), ("red", 5))
+        self.assertIsNone(parent.display)
+
+
+class TestRestyle(unittest.TestCase):
+    def setUp(self):
+        self.tree = HTMLParser(
+            '<div class="a"><p class="note">x</p><p>y</p></div><ul><li>z</li></ul>'
+        ).parse()
+        self.index = CompiledStylesheet(CSSParser(STYLESHEET).parse())
+        style(self.tree, self.index)
+        self.nodes = tree_to_list(self.tree, [])
+
+    def find_all(self, tag):
+        return [n for n in self.nodes if getattr(n, "tag", "") == tag]
+
+    def test_clean_tree_is_not_restyled(self):
+        self.assertFalse(self.tree.needs_restyle())
+        li = self.find_all("li")[0]
+        li.style = None
+        restyle(self.tree, self.index)
+        self.assertIsNone(li.style)
+
+    def test_value_change_keeps_styles(self):
+        p = self.find_all("p")[1]
+        p.set_attribute("value", "1")
+        self.assertFalse(self.tree.needs_restyle())
+
+    def test_style_attribute_restyles_node_and_inheriting_children(self):
+        li = self.find_all("li")[0]
+        p = self.find_all("p")[0]
+        p.style = None
+        li.set_attribute("style", "color: green")
+        self.assertTrue(self.tree.dirty_children)
+        restyle(self.tree, self.index)
+        self.assertEqual(li.style["color"], "green")
+        self.assertEqual(li.children[0].style["color"], "green")
+        # other subtrees are not visited
+        self.assertIsNone(p.style)
+        self.assertFalse(self.tree.needs_restyle())
+
+    def test_class_change_restyles_subtree(self):
+        div = self.find_all("div")[0]
+        p = self.find_all("p")[0]
+        self.assertEqual(p.style["font-weight"], "bold")
+        div.set_attribute("class", "b")
+        restyle(self.tree, self.index)
+        # still a div .note, but every descendant was recomputed
+        self.assertEqual(p.style["font-weight"], "bold")
+        p.set_attribute("class", "other")
+        restyle(self.tree, self.index)
+        self.assertEqual(p.style["font-weight"], "normal")
+
+    def test_new_children_are_styled(self):
+        ul = self.find_all("ul")[0]
+        new_nodes = HTMLParser("<li><span>new</span></li>").parse_fragment(ul)
+        ul.children = new_nodes
+        for node in new_nodes:
+            mark_style_dirty(node)
+        restyle(self.tree, self.index)
+        span = new_nodes[0].children[0]
+        self.assertEqual(span.style["cursor"], "pointer")
+        self.assertEqual(span.children[0].style["cursor"], "pointer")
@@ -0,0 +1,65 @@
+import hashlib
+from css_parser import CSSParser
+from lru import LRUCache
+from media_queries import MediaGroup
+from style import CompiledStylesheet, Rule
+
+STYLESHEET_CACHE_MAX_BYTES = 4 * 1024 * 1024
+
+
+def css_digest(css: str) -> str:
+    return hashlib.blake2b(css.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class StylesheetCache:
+    """Parsed stylesheets shared by every tab, keyed by a digest of their text
+
+    Holds the rules of single sheets, sized by their CSS source bytes, and
+    the compiled stylesheets of whole pages, sized by their indexes plus
+    the bounds of their memo caches. Entries are shared read-only, a
+    compiled stylesheet only fills its own memo caches.
+    """
+
+    def __init__(self, max_bytes: int = STYLESHEET_CACHE_MAX_BYTES):
+        self.entries = LRUCache(max_bytes)
+
+    def parse_sheet(self, css: str) -> tuple[tuple[Rule, ...], tuple[MediaGroup, ...]]:
+        """The rules of a sheet and the rules of its @media blocks"""
+        key = ("rules", css_digest(css))
+        sheet = self.entries.get(key)
+        if sheet is None:
+            parser = CSSParser(css)
+            sheet = (tuple(parser.parse()), tuple(parser.media_groups))
+            self.entries.put(key, sheet, len(css.encode("utf-8")))
+        return sheet
+
+    def parse(self, css: str) -> tuple[Rule, ...]:
+        return self.parse_sheet(css)[0]
+
+    def compile(self, sheets: list[str]) -> CompiledStylesheet:
+        """Stylesheet of a page that uses sheets, in cascade source order"""
+        key = ("compiled", tuple(css_digest(css) for css in sheets))
+        stylesheet = self.entries.get(key)
+        if stylesheet is None:
+            rules = []
+            media_groups = []
+            for css in sheets:
+                sheet_rules, sheet_groups = self.parse_sheet(css)
+                # positions count the rules of the sheets before too
+                for group in sheet_groups:
+                    media_groups.append(
+                        MediaGroup(
+                            group.conditions, group.rules, group.position + len(rules)
+                        )
+                    )
+                rules.extend(sheet_rules)
+            stylesheet = CompiledStylesheet(rules, media_groups)
+            # the rules themselves are charged to their sheets' entries
+            self.entries.put(key, stylesheet, stylesheet.max_bytes())
+        return stylesheet
+
+    def stats(self) -> dict[str, int]:
+        return self.entries.stats()
+
+
+STYLESHEET_CACHE = StylesheetCache()
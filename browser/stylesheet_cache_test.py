@@ -0,0 +1,49 @@
+import unittest
+
+from stylesheet_cache import StylesheetCache
+
+COMMON_CSS = "p { color: red; } .note { font-weight: bold; }"
+PAGE_CSS = "h1 { font-size: 200%; }"
+
+
+class TestStylesheetCache(unittest.TestCase):
+    def test_parses_each_sheet_once(self):
+        cache = StylesheetCache()
+        rules = cache.parse(COMMON_CSS)
+        self.assertEqual(len(rules), 2)
+        self.assertIs(cache.parse(COMMON_CSS), rules)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_pages_with_the_same_sheets_share_a_stylesheet(self):
+        cache = StylesheetCache()
+        first = cache.compile([COMMON_CSS, PAGE_CSS])
+        self.assertIs(cache.compile([COMMON_CSS, PAGE_CSS]), first)
+        # a different page still reuses the parsed common sheet
+        other = cache.compile([COMMON_CSS])
+        self.assertIsNot(other, first)
+        self.assertIs(other.rules[0][1], first.rules[0][1])
+
+    def test_media_groups_keep_their_place_across_sheets(self):
+        cache = StylesheetCache()
+        media_css = "@media (max-width: 9000px) { p { color: blue; } }"
+        stylesheet = cache.compile([COMMON_CSS, media_css])
+        self.assertEqual(stylesheet.media_groups[0].position, 2)
+        # after the common sheet's p rule, .note sorts first
+        self.assertIs(cache.parse_sheet(media_css)[1][0].rules[0], stylesheet.rules[2])
+        self.assertEqual(stylesheet.active_groups, (True,))
+
+    def test_compiled_stylesheets_are_charged_their_indexes(self):
+        cache = StylesheetCache()
+        cache.parse(COMMON_CSS)
+        source_size = cache.stats()["size"]
+        stylesheet = cache.compile([COMMON_CSS])
+        compiled_size = cache.stats()["size"] - source_size
+        self.assertEqual(compiled_size, stylesheet.max_bytes())
+        self.assertGreater(compiled_size, stylesheet.candidates_cache.max_size)
+
+    def test_evicts_by_source_bytes(self):
+        cache = StylesheetCache(max_bytes=len(COMMON_CSS))
+        cache.parse(COMMON_CSS)
+        cache.parse(PAGE_CSS)
+        self.assertLessEqual(cache.stats()["size"], len(COMMON_CSS))
+        self.assertGreater(cache.stats()["evictions"], 0)
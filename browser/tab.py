@@ -1,26 +1,26 @@
 import time
 import typing
 import urllib.parse
-from css_parser import CSSParser, Selector
-from display_constants import DEFAULT_FONT_SIZE_PX, CLEARABLE_CONTENT_TAG, VSTEP, WIDTH
+from concurrent.futures import Executor
+from display_constants import CLEARABLE_CONTENT_TAG, VSTEP, WIDTH
+from document_cache import DOCUMENT_CACHE, PendingParse
 from draw_commands import DrawRect
 from enum import Enum
-from html_parser import Element, Node, Text, HTMLParser, tree_to_list
-from layout import DocumentLayout
+from html_parser import Element, Node, Text, mark_style_dirty, tree_to_list
+from layout import DocumentLayout, TextRunLayout
+from media_queries import Viewport
+from parser_backends import DEFAULT_PARSER_BACKEND, get_parser_backend
 from js_context import JSContext, JSEvent
+from style import CompiledStylesheet, restyle
+from style_profiler import StyleProfiler
+from stylesheet_cache import STYLESHEET_CACHE
 from url import URL
 
-DEFAULT_STYLE_SHEET = CSSParser(open("browser.css").read()).parse()
+DEFAULT_STYLE_SHEET_CSS = open("browser.css").read()
 VIEW_SOURCE = "view-source:"
-
-INHERITED_PROPERTIES = {
-    "font-family": "Times",
-    "font-size": f"{DEFAULT_FONT_SIZE_PX}px",
-    "font-style": "normal",
-    "font-weight": "normal",
-    "color": "black",
-    "cursor": "auto",
-}
+# bodies at least this big are parsed in a worker process when a pool is given
+PARSE_IN_WORKER_MIN_BYTES = 256 * 1024
+LOADING_HTML = "<html><body><p>Loading...</p></body></html>"
 
 
 class LoadAction(Enum):
@@ -35,9 +35,16 @@ class Tab:
         cookie_jar: dict[str, str],
         cache: dict[URL, (str, int, int)],
         tab_height: int,
+        parse_pool: typing.Optional[Executor] = None,
+        parser_backend: str = DEFAULT_PARSER_BACKEND,
+        profile_style: str | None = None,
     ):
         self.cookie_jar = cookie_jar
         self.cache = cache
+        self.parse_pool = parse_pool
+        # fail early on a typo rather than on the first page load
+        self.parser_backend = get_parser_backend(parser_backend).name
+        self.pending_parse: tuple[PendingParse, URL, dict[str, str]] | None = None
         self.title = ""
         self.backward_history = []
         self.forward_history = []
@@ -45,7 +52,12 @@ class Tab:
         self.scroll_offset = 0
         self.url = None
         self.focus = None
+        self.nodes = None
+        self.stylesheet = CompiledStylesheet([])
+        self.document: DocumentLayout | None = None
         self.display_list = []
+        # prints per rule style costs after each page load, text or json
+        self.style_profiler = StyleProfiler(profile_style) if profile_style else None
 
     def has_back_history(self) -> bool:
         return len(self.backward_history) > 1
@@ -56,7 +68,7 @@ class Tab:
     def is_request_allowed(self, u: URL):
         return not self.allowed_origins or u.origin() in self.allowed_origins
 
-    def load_stylesheets(self, nodes_list: list[Node]):
+    def load_stylesheets(self, nodes_list: list[Node]) -> CompiledStylesheet:
         links = [
             node.attributes["href"]
             for node in nodes_list
@@ -65,7 +77,7 @@ class Tab:
             and node.attributes.get("rel") == "stylesheet"
             and "href" in node.attributes
         ]
-        rules = DEFAULT_STYLE_SHEET.copy()
+        sheets = [DEFAULT_STYLE_SHEET_CSS]
         for link in links:
             style_url = self.url.resolve(link)
             if not self.is_request_allowed(style_url):
@@ -80,10 +92,9 @@ class Tab:
                     self.cache_request(style_url, headers, css, cache_time)
             except:
                 continue
-            new_rules = CSSParser(css).parse()
-            # print(new_rules)
-            rules.extend(new_rules)
-        return rules
+            sheets.append(css)
+        # sheets seen before, in any tab, are not parsed again
+        return STYLESHEET_CACHE.compile(sheets)
 
     def load_javascript(self, nodes_list: list[Node]):
         scripts = [
@@ -144,8 +155,42 @@ class Tab:
             except ConnectionError as e:
                 headers = {}
                 body = create_error_html(e)
+        # a newer load wins over a document still being parsed
+        if self.pending_parse:
+            self.pending_parse[0].cancel()
+            self.pending_parse = None
+        if is_view_source:
+            nodes = Text(None, body)
+            nodes.rehash()
+        elif (
+            self.parse_pool
+            and len(body) >= PARSE_IN_WORKER_MIN_BYTES
+            and not DOCUMENT_CACHE.contains(body, self.parser_backend)
+        ):
+            pending = DOCUMENT_CACHE.parse_in_worker(
+                body, self.parse_pool, self.parser_backend
+            )
+            self.pending_parse = (pending, new_url, headers)
+            self.show_loading(new_url)
+            return
+        else:
+            nodes = DOCUMENT_CACHE.parse(body, self.parser_backend)
+        self.finish_load(new_url, headers, nodes)
+
+    def finish_load(self, new_url: URL, headers: dict[str, str], nodes: Node):
+        # a reused tree still holds the old focus, its caret must go
+        had_focus = self.clear_focus()
+        if self.style_profiler:
+            self.style_profiler.reset()
+        # reloading an identical document keeps the styled tree and layout
+        is_same_document = (
+            self.url == new_url
+            and self.nodes is not None
+            and self.nodes.subtree_hash == nodes.subtree_hash
+        )
         self.url = new_url
-        self.nodes = Text(None, body) if is_view_source else HTMLParser(body).parse()
+        if not is_same_document:
+            self.nodes = nodes
         self.allowed_origins = None
         if "content-security-policy" in headers:
             csp = headers["content-security-policy"].split()
@@ -154,7 +199,11 @@ class Tab:
                 for origin in csp[1:]:
                     self.allowed_origins.append(URL({}, origin).origin())
         nodes_list = tree_to_list(self.nodes, [])
-        self.rules = self.load_stylesheets(nodes_list)
+        stylesheet = self.load_stylesheets(nodes_list)
+        media_changed = stylesheet.set_viewport(self.viewport())
+        if stylesheet is not self.stylesheet or media_changed:
+            self.stylesheet = stylesheet
+            mark_style_dirty(self.nodes, subtree=True)
         self.load_javascript(nodes_list)
         titles = [
             node.children[0].text
@@ -162,11 +211,49 @@ class Tab:
             if isinstance(node, Element) and node.tag == "title"
         ]
         self.title = titles[0] if len(titles) else ""
+        if self.nodes.needs_restyle() or had_focus:
+            self.render()
+        if self.style_profiler:
+            print(f"style profile for {new_url}")
+            print(self.style_profiler.report())
+
+    def show_loading(self, new_url: URL):
+        """Shows a placeholder page until the parse worker is done"""
+        self.url = new_url
+        self.clear_focus()
+        self.nodes = DOCUMENT_CACHE.parse(LOADING_HTML)
+        self.stylesheet = STYLESHEET_CACHE.compile([DEFAULT_STYLE_SHEET_CSS])
+        self.title = ""
         self.render()
 
+    def poll_parse(self) -> bool:
+        """Finishes loading when the parse worker is done
+
+        Returns:
+            bool: True when a new page was loaded and should be drawn
+        """
+        if not self.pending_parse or not self.pending_parse[0].done():
+            return False
+        pending, new_url, headers = self.pending_parse
+        self.pending_parse = None
+        self.finish_load(new_url, headers, pending.result())
+        return True
+
+    def viewport(self) -> Viewport:
+        return Viewport(WIDTH, self.tab_height)
+
     def render(self):
-        style(self.nodes, sorted(self.rules, key=cascade_priority))
-        self.document = DocumentLayout(self.nodes)
+        """Restyles the dirty nodes, then lays out and paints the page"""
+        # stylesheets are shared, another tab may have set its viewport
+        if self.stylesheet.set_viewport(self.viewport()):
+            mark_style_dirty(self.nodes, subtree=True)
+        if self.style_profiler:
+            self.style_profiler.restyle(self.nodes, self.stylesheet)
+        else:
+            restyle(self.nodes, self.stylesheet)
+        # boxes of unchanged nodes are kept from the last render
+        if self.document is None or self.document.node is not self.nodes:
+            self.document = DocumentLayout(self.nodes)
         self.document.layout()
         self.display_list = []
         paint_tree(self.document, self.display_list)
@@ -223,10 +310,16 @@ class Tab:
         max_y = max(self.document.height + VSTEP - self.tab_height, 0)
         self.scroll_offset = min(max(0, self.scroll_offset + offset), max_y)
 
+    def clear_focus(self) -> bool:
+        """Unfocuses the focused element, True if there was one"""
+        if not self.focus:
+            return False
+        self.focus.is_focused = False
+        self.focus = None
+        return True
+
     def blur(self):
-        if self.focus:
-            self.focus.is_focused = False
-            self.focus = None
+        if self.clear_focus():
             self.render()
 
     def keypress(self, char):
@@ -234,7 +327,7 @@ class Tab:
             if self.js.dispatch_event(JSEvent.KEYDOWN, self.focus, char):
                 return
             if self.focus.tag == "input":
-                self.focus.attributes["value"] += char
+                self.focus.set_attribute("value", self.focus.attributes["value"] + char)
                 self.render()
                 return True
         return False
@@ -248,7 +341,7 @@ class Tab:
                 # return if there is nothing to delete
                 if not orig_value:
                     return False
-                self.focus.attributes["value"] = orig_value[:-1]
+                self.focus.set_attribute("value", orig_value[:-1])
                 self.render()
                 return True
         return False
@@ -272,7 +365,10 @@ class Tab:
         objs = [
             obj
             for obj in layout_list
-            if obj.x <= x < obj.x + obj.width and obj.y <= y < obj.y + obj.height
+            if obj.x <= x < obj.x + obj.width
+            and obj.y <= y < obj.y + obj.height
+            # runs span the spaces between their words
+            and (not isinstance(obj, TextRunLayout) or obj.word_at(x) is not None)
         ]
         # print(objs)
         if not objs:
@@ -296,7 +392,7 @@ class Tab:
             elif elt.tag == "input":
                 if self.js.dispatch_event(JSEvent.CLICK, elt):
                     return
-                elt.attributes["value"] = ""
+                elt.set_attribute("value", "")
                 if self.focus:
                     self.focus.is_focused = False
                 self.focus = elt
@@ -342,54 +438,14 @@ class Tab:
         return elt
 
 
-def style(node: Node, rules: list[tuple[Selector, dict[str, str]]]):
-    # pass down inherited or default values
-    for property, default_value in INHERITED_PROPERTIES.items():
-        if node.parent:
-            node.style[property] = node.parent.style[property]
-        else:
-            node.style[property] = default_value
-    # apply rules from CSS stylesheets
-    for selector, body in rules:
-        if not selector.matches(node):
-            continue
-        for prop, val in body.items():
-            node.style[prop] = val
-    # apply rules from 'style' attribute
-    if isinstance(node, Element) and "style" in node.attributes:
-        pairs = CSSParser(node.attributes["style"]).body()
-        for property, value in pairs.items():
-            node.style[property] = value
-    # compute actual values for percentages
-    node_font_size = node.style["font-size"]
-    if node.parent:
-        parent_font_size = node.parent.style["font-size"]
-    else:
-        parent_font_size = INHERITED_PROPERTIES["font-size"]
-    if node_font_size.endswith("%"):
-        node_pct = float(node_font_size[:-1]) / 100
-        parent_px = float(parent_font_size[:-2])
-        node.style["font-size"] = str(node_pct * parent_px) + "px"
-    elif node_font_size == "inherit":
-        node.style["font-size"] = parent_font_size
-
-    # recursively style the rest of the tree
-    for child in node.children:
-        style(child, rules)
-
-
 def create_error_html(exception: ConnectionError) -> str:
     return f"<html><body><h1>Page load error</h1><p>{exception}</p></body></html>"
 
 
-def cascade_priority(rule):
-    selector, body = rule
-    return selector.priority
-
-
 def paint_tree(layout_object, display_list):
-    if layout_object.should_paint():
-        display_list.extend(layout_object.paint())
-
-    for child in layout_object.children:
-        paint_tree(child, display_list)
+    stack = [layout_object]
+    while stack:
+        layout_object = stack.pop()
+        if layout_object.should_paint():
+            display_list.extend(layout_object.paint())
+        stack.extend(reversed(layout_object.children))
@@ -0,0 +1,44 @@
+import unittest
+
+from draw_commands import DrawLine
+from html_parser import Element, HTMLParser, tree_to_list
+from tab import Tab
+from url import URL
+
+HTML = "<html><body><p>name <input value=a></p></body></html>"
+
+
+class TestFocus(unittest.TestCase):
+    def setUp(self):
+        self.tab = Tab({}, {}, 500)
+        self.url = URL({}, "file:///focus.html")
+        self.tab.finish_load(self.url, {}, HTMLParser(HTML).parse())
+        self.input = next(
+            n
+            for n in tree_to_list(self.tab.nodes, [])
+            if isinstance(n, Element) and n.tag == "input"
+        )
+        self.tab.focus = self.input
+        self.input.is_focused = True
+        self.tab.render()
+
+    def has_caret(self):
+        return any(isinstance(cmd, DrawLine) for cmd in self.tab.display_list)
+
+    def test_same_document_reload_clears_focus(self):
+        self.assertTrue(self.has_caret())
+        self.tab.finish_load(self.url, {}, HTMLParser(HTML).parse())
+        # the tree was reused, with the same input
+        self.assertIn(self.input, tree_to_list(self.tab.nodes, []))
+        self.assertIsNone(self.tab.focus)
+        self.assertFalse(self.input.is_focused)
+        self.assertFalse(self.has_caret())
+
+    def test_show_loading_clears_focus(self):
+        self.tab.show_loading(self.url)
+        self.assertIsNone(self.tab.focus)
+        self.assertFalse(self.input.is_focused)
+
+
+if __name__ == "__main__":
+    unittest.main()